@@ -1,20 +1,61 @@
 import json
 import logging
+import mimetypes
+import numpy as np
 
-from flask import Flask, request, jsonify, send_from_directory, abort
+from flask import Flask, Response, request, jsonify, send_from_directory, abort
+from werkzeug.security import safe_join
 import os
 from dev.backend.src.parsers.excel_parser import ExcelParser
 from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
 from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.analyzers.density_analyzer import DensityAnalyzer
+from dev.backend.src.analyzers.concurrency_analyzer import ConcurrencyAnalyzer, WINDOWS
+from dev.backend.src.analyzers.proximity_index import FlightProximityIndex
+from dev.backend.src.analyzers.sample_estimator import RegionShareEstimator
+from dev.backend.src.storage.flight_store import FlightStore
+from dev.backend.src.services.processing_service import process_excel_files
+from dev.backend.src.services.preview_service import PreviewJob, get_job, publish_preview
+from dev.backend.src.services.upload_service import UploadReceiver, accepted_paths, iter_in_background
+from dev.backend.src.services.publish_service import COMPRESSED_ENCODINGS, fresh_sidecar
+from dev.backend.src.services.stats_feed import StatsFeed, load_versions, publish_stats
+from dev.backend.config import USE_SQLITE_STORAGE, SQLITE_DB_PATH, SQLITE_BATCH_SIZE, DENSITY_PATH, \
+    REGION_RATING_PATH, FLIGHT_INTERVALS_PATH, FLIGHT_TREE_PATH, NEAR_MAX_RADIUS_KM, NEAREST_MAX_POINTS, \
+    NEAREST_MAX_COUNT, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_UNZIPPED_BYTES, PREVIEW_Z, STATS_VERSIONS_PATH, \
+    SSE_POLL_SECONDS, SSE_HEARTBEAT_SECONDS, SSE_MAX_STREAM_SECONDS, SSE_RETRY_MS, DATA_DIR, \
+    FRONTEND_STATIC_DIR, PUBLISH_DIR, FRONTEND_STATS_PATH
 from glob import glob
+from itertools import chain
+from datetime import date, datetime, timedelta
+from dev.backend.src.utils.region_registry import get_region_registry
+
+# No built-in static route: every file goes through static_files() so published data can be served pre-compressed
+app = Flask(__name__, static_folder=None)
+app.static_folder = os.path.abspath(FRONTEND_STATIC_DIR)
+mimetypes.add_type('application/x-ndjson', '.ndjson')
+_store = None
+_density_cache = {"mtime": None, "cells": None}
+_rating_cache = {"mtime": None, "rating": None}
+_intervals_cache = {"mtime": None, "intervals": None}
+_proximity_cache = {"mtime": None, "index": None}
+_stats_feed = None
+
+
+def get_store() -> FlightStore:
+    """Возвращает общее SQLite-хранилище (создается при первом обращении)"""
+    global _store
+    if _store is None:
+        _store = FlightStore(SQLITE_DB_PATH, SQLITE_BATCH_SIZE)
+    return _store
+
+
+def get_stats_feed() -> StatsFeed:
+    """Возвращает наблюдатель за версиями статистики (один на процесс)"""
+    global _stats_feed
+    if _stats_feed is None:
+        _stats_feed = StatsFeed(STATS_VERSIONS_PATH, SSE_POLL_SECONDS)
+    return _stats_feed
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(os.path.dirname(BASE_DIR))
-FRONTEND_STATIC_FOLDER = os.path.join(PROJECT_ROOT, 'dev', 'frontend', 'public')
-FRONTEND_STATS_PATH = os.path.join(FRONTEND_STATIC_FOLDER, 'flight_statistics.json')
-FRONTEND_JSON_PATH = os.path.join(FRONTEND_STATIC_FOLDER, 'all_data_from_back.json')
-DATA_DIR = os.path.join(PROJECT_ROOT, 'dev', 'backend', 'data')
-app = Flask(__name__, static_folder=FRONTEND_STATIC_FOLDER, static_url_path='')
 
 @app.route('/')
 def index():
@@ -22,7 +63,33 @@ def index():
 
 @app.route('/<path:path>')
 def static_files(path):
-    return send_from_directory(app.static_folder, path)
+    """Отдает файлы фронтенда; для опубликованных данных выбирается сжатая копия по Accept-Encoding"""
+    # Published data may live outside the frontend folder (LCT_PUBLISH_DIR); it takes precedence there
+    folder = os.path.abspath(PUBLISH_DIR)
+    full_path = safe_join(folder, path)
+    if full_path is None or not os.path.isfile(full_path):
+        folder = app.static_folder
+        full_path = safe_join(folder, path)
+    if full_path is None or not os.path.isfile(full_path):
+        return send_from_directory(folder, path)
+
+    has_sidecars = False
+    for encoding, suffix in COMPRESSED_ENCODINGS:
+        if fresh_sidecar(full_path, suffix) is None:
+            continue
+        has_sidecars = True
+        if request.accept_encodings[encoding]:
+            # send_file handles strong ETag, If-None-Match and Range on the encoded bytes
+            response = send_from_directory(folder, path + suffix,
+                                           mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+
+    response = send_from_directory(folder, path)
+    if has_sidecars:
+        response.vary.add('Accept-Encoding')
+    return response
 
 
 @app.route('/flights_percent', methods=['GET'])
@@ -50,34 +117,292 @@ def get_flights_percent():
         abort(500, description="Internal server error")
 
 
+@app.route('/flights_percent/stream', methods=['GET'])
+def flights_percent_stream():
+    """Server-Sent Events: снимок статистики, затем только изменившиеся регионы с номером версии"""
+    # EventSource resends the last id on reconnect; the query parameter serves clients that cannot set headers
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = get_stats_feed().stream(last_event_id, SSE_HEARTBEAT_SECONDS, SSE_MAX_STREAM_SECONDS, SSE_RETRY_MS)
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @app.route('/upload', methods=['POST'])
 def upload():
-    if not os.path.exists(DATA_DIR):
-        os.makedirs(DATA_DIR)
-    for file in request.files.getlist('files'):
-        file.save(os.path.join(DATA_DIR, file.filename))
-    excel_parser = ExcelParser()
-    uav_parser = UAVFlightParser()
+    """Принимает файлы потоком: каждая книга разбирается, пока следующие еще передаются или распаковываются"""
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        abort(400, description="Expected multipart/form-data")
+    os.makedirs(DATA_DIR, exist_ok=True)
+    # Files already on disk are processed first; new uploads follow as soon as each one is stored
+    existing_files = glob(os.path.join(DATA_DIR, "*.xlsx")) + glob(os.path.join(DATA_DIR, "*.xls"))
+    receiver = UploadReceiver(DATA_DIR, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_UNZIPPED_BYTES)
+    uploads = []
+    received = iter_in_background(receiver.receive(request.stream, boundary.encode('latin-1')))
+
+    if request.args.get('preview') == '1':
+        # The body has to be read before responding; parsing moves to a background job
+        new_files = list(accepted_paths(received, uploads))
+        if not new_files:
+            return upload_response({}, uploads)
+        excel_files = existing_files + new_files
+        job = PreviewJob([upload.to_dict() for upload in uploads])
+        # Statistics published before the estimate: they come back if the job fails
+        previous_stats = (load_versions(STATS_VERSIONS_PATH) or {}).get("stats", {})
+        job.start(lambda running: preview_files(excel_files, running), lambda: process_files(excel_files),
+                  lambda: publish_stats(FRONTEND_STATS_PATH, previous_stats))
+        response = jsonify(job.to_dict())
+        response.headers['Location'] = f"/upload/status/{job.id}"
+        return response, 202
+
+    # Nothing is parsed before the first file is accepted: an upload of duplicates only gets its 409 at once
+    accepted = accepted_paths(received, uploads)
+    first_file = next(accepted, None)
+    if first_file is None:
+        return upload_response({}, uploads)
+    stats = process_files(chain(existing_files, [first_file], accepted))
+    return upload_response(stats, uploads)
+
+
+@app.route('/upload/status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Состояние фоновой обработки загрузки"""
+    job = get_job(job_id)
+    if job is None:
+        abort(404, description="Unknown upload job")
+    return jsonify(job.to_dict())
+
+
+def process_files(excel_files):
+    """Полная обработка файлов, как в main.py; в режиме SQLite - через общее хранилище процесса"""
+    return process_excel_files(excel_files, get_store() if USE_SQLITE_STORAGE else None)
+
+
+def preview_files(excel_files, job):
+    """Публикует приближенную статистику по выборке строк файлов, которые затем обработает process_files"""
     analyzer = RegionAnalyzer()
-    excel_files = glob(os.path.join(DATA_DIR, "*.xlsx")) + glob(os.path.join(DATA_DIR, "*.xls"))
-    all_flights = []
-    for file_path in excel_files:
-        flights = excel_parser.parse_excel(file_path, uav_parser)
-        all_flights.extend(flights)
-    with open(FRONTEND_JSON_PATH, 'w', encoding='utf-8') as f:
-        import json
-        json.dump([flight.to_dict() for flight in all_flights], f, ensure_ascii=False, indent=4)
-    stats = analyzer.compute_flight_statistics(all_flights)
-    with open(FRONTEND_STATS_PATH, 'w', encoding='utf-8') as f:
-        import json
-        json.dump(stats, f, ensure_ascii=False, indent=4)
+    estimator = None
+    if USE_SQLITE_STORAGE:
+        # Ingested files are counted exactly by the store; only the new ones are sampled
+        store = get_store()
+        excel_files = [path for path in excel_files if not store.is_ingested(path)]
+        region_counts, total = store.region_counts()
+        estimator = RegionShareEstimator(analyzer, PREVIEW_Z, region_counts, total)
+    publish_preview(excel_files, ExcelParser(), UAVFlightParser(), analyzer, FRONTEND_STATS_PATH, job, estimator)
+
+
+def upload_response(stats, uploads):
+    """Ответ на загрузку: статистика, а если ни один файл не принят - 409 со списком причин"""
+    if uploads and not any(upload.status == 'accepted' for upload in uploads):
+        return jsonify({"error": "No new files were accepted",
+                        "uploads": [upload.to_dict() for upload in uploads]}), 409
     return jsonify(stats)
 
-# Other endpoints (not implemented)
+
+@app.route('/flights/density', methods=['GET'])
+def flights_density():
+    """Плотность точек взлета по ячейкам geohash: ?res=<длина geohash>&bbox=min_lat,min_lon,max_lat,max_lon"""
+    if not os.path.exists(DENSITY_PATH):
+        abort(404, description="Density data not found")
+
+    # Precomputed arrays are loaded once and reloaded only after a new ingest
+    mtime = os.path.getmtime(DENSITY_PATH)
+    if _density_cache["mtime"] != mtime:
+        _density_cache["cells"] = DensityAnalyzer.load(DENSITY_PATH)
+        _density_cache["mtime"] = mtime
+    cells = _density_cache["cells"]
+    if not cells:
+        abort(404, description="Density data has no resolutions")
+
+    try:
+        resolution = request.args.get('res')
+        resolution = int(resolution) if resolution is not None else min(cells)
+        bbox = request.args.get('bbox')
+        if bbox:
+            bbox = tuple(float(value) for value in bbox.split(','))
+            if len(bbox) != 4:
+                raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+    except ValueError as e:
+        abort(400, description=str(e))
+    if resolution not in cells:
+        abort(400, description=f"Unsupported resolution, available: {sorted(cells)}")
+
+    return jsonify(DensityAnalyzer.query(cells, resolution, bbox))
+
+
+@app.route('/regions/rating', methods=['GET'])
+def regions_rating():
+    """Рейтинг регионов по активности БВС на 1000 км²: ?sort=<показатель>&limit=<N>"""
+    if not os.path.exists(REGION_RATING_PATH):
+        abort(404, description="Rating data not found")
+
+    # The rating is recomputed at ingest; requests only re-read it after the file changes
+    mtime = os.path.getmtime(REGION_RATING_PATH)
+    if _rating_cache["mtime"] != mtime:
+        with open(REGION_RATING_PATH, 'r', encoding='utf-8') as f:
+            _rating_cache["rating"] = json.load(f)
+        _rating_cache["mtime"] = mtime
+    rating = _rating_cache["rating"]
+
+    regions = rating["regions"]
+    sort = request.args.get('sort', 'score')
+    if sort != 'score':
+        if not regions or sort not in regions[0] or sort in ('rank', 'code', 'name'):
+            abort(400, description=f"Unsupported sort field: {sort}")
+        regions = sorted(regions, key=lambda region: -region[sort])
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        regions = regions[:max(limit, 0)]
+    return jsonify({"weights": rating["weights"], "regions": regions})
+
+
+@app.route('/flights/peak_concurrency', methods=['GET'])
+def peak_concurrency():
+    """Максимум одновременных полетов по регионам: ?window=all|day|week&region=&date_from=&date_to=&sort=peak"""
+    if not os.path.exists(FLIGHT_INTERVALS_PATH):
+        abort(404, description="Flight intervals not found")
+
+    mtime = os.path.getmtime(FLIGHT_INTERVALS_PATH)
+    if _intervals_cache["mtime"] != mtime:
+        _intervals_cache["intervals"] = ConcurrencyAnalyzer.load(FLIGHT_INTERVALS_PATH)
+        _intervals_cache["mtime"] = mtime
+    intervals = _intervals_cache["intervals"]
+
+    window = request.args.get('window', 'all')
+    if window not in WINDOWS:
+        abort(400, description=f"Unsupported window, available: {list(WINDOWS)}")
+    try:
+        region = request.args.get('region', type=int)
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+        date_from = ConcurrencyAnalyzer.to_minutes(datetime.fromisoformat(date_from)) if date_from else None
+        # date_to is inclusive: clip at the end of that day
+        date_to = ConcurrencyAnalyzer.to_minutes(
+            datetime.combine(date.fromisoformat(date_to), datetime.min.time()) + timedelta(days=1)) if date_to else None
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    codes, start, end = intervals["code"], intervals["start"], intervals["end"]
+    mask = np.ones(len(codes), dtype=bool)
+    if region is not None:
+        mask &= codes == region
+    if date_from is not None:
+        mask &= end > date_from
+    if date_to is not None:
+        mask &= start < date_to
+    codes, start, end = codes[mask], start[mask], end[mask]
+    if date_from is not None:
+        start = np.maximum(start, date_from)
+    if date_to is not None:
+        end = np.minimum(end, date_to)
+
+    peaks = ConcurrencyAnalyzer.peaks(codes, start, end, window)
+    order = np.arange(len(peaks["peak"]))
+    if request.args.get('sort') == 'peak':
+        order = np.lexsort((peaks["window"], peaks["code"], -peaks["peak"]))
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        order = order[:max(limit, 0)]
+
+    registry = get_region_registry()
+    result = []
+    for i in order:
+        window_start, window_end = ConcurrencyAnalyzer.window_bounds(window, peaks["window"][i])
+        result.append({
+            "code": int(peaks["code"][i]),
+            "name": registry.name(peaks["code"][i]),
+            "window_start": window_start,
+            "window_end": window_end,
+            "peak": int(peaks["peak"][i]),
+            "peak_start": ConcurrencyAnalyzer.from_minutes(peaks["peak_start"][i]),
+            "peak_end": ConcurrencyAnalyzer.from_minutes(peaks["peak_end"][i]),
+            "flights": int(peaks["flights"][i]),
+        })
+    return jsonify({"window": window, "peaks": result})
+
+
+def get_proximity_index() -> FlightProximityIndex:
+    """Индекс близости, построенный при импорте (перечитывается только после нового импорта)"""
+    if not os.path.exists(FLIGHT_TREE_PATH):
+        abort(404, description="Proximity index not found")
+    mtime = os.path.getmtime(FLIGHT_TREE_PATH)
+    if _proximity_cache["mtime"] != mtime:
+        _proximity_cache["index"] = FlightProximityIndex.load(FLIGHT_TREE_PATH)
+        _proximity_cache["mtime"] = mtime
+    return _proximity_cache["index"]
+
+
+def parse_point(lat, lon) -> tuple:
+    """Проверяет координаты точки запроса"""
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("lat must be in [-90, 90] and lon in [-180, 180]")
+    return lat, lon
+
+
+@app.route('/flights/near', methods=['GET'])
+def flights_near():
+    """Полеты с точкой взлета или посадки в радиусе: ?lat=&lon=&radius_km=&limit="""
+    try:
+        lat, lon = parse_point(request.args.get('lat'), request.args.get('lon'))
+        radius_km = float(request.args.get('radius_km', 10))
+        if not 0 < radius_km <= NEAR_MAX_RADIUS_KM:
+            raise ValueError(f"radius_km must be in (0, {NEAR_MAX_RADIUS_KM}]")
+        limit = min(request.args.get('limit', 1000, type=int), 10000)
+    except (TypeError, ValueError) as e:
+        abort(400, description=str(e))
+    return jsonify(get_proximity_index().near(lat, lon, radius_km, limit))
+
+
+@app.route('/flights/nearest', methods=['POST'])
+def flights_nearest():
+    """N ближайших полетов к каждой точке: {"points": [{"lat": .., "lon": ..}, ...], "n": 5}"""
+    body = request.get_json(silent=True) or {}
+    try:
+        points = [parse_point(point['lat'], point['lon']) for point in body.get('points', [])]
+        if not points or len(points) > NEAREST_MAX_POINTS:
+            raise ValueError(f"points must contain 1..{NEAREST_MAX_POINTS} items")
+        count = int(body.get('n', 5))
+        if not 0 < count <= NEAREST_MAX_COUNT:
+            raise ValueError(f"n must be in 1..{NEAREST_MAX_COUNT}")
+    except (KeyError, TypeError, ValueError) as e:
+        abort(400, description=str(e))
+
+    index = get_proximity_index()
+    return jsonify([{"lat": lat, "lon": lon, "flights": index.nearest(lat, lon, count)} for lat, lon in points])
+
+
 @app.route('/flights/filter', methods=['GET'])
 def filter_flights():
-    pass  # Filter by date/region/etc from all_data_from_back.json
+    """Фильтр полетов по дате, региону и прямоугольнику координат (требует SQLite-хранилища)"""
+    if not USE_SQLITE_STORAGE:
+        abort(501, description="SQLite storage is disabled (set LCT_USE_SQLITE=1)")
+    try:
+        bbox = request.args.get('bbox')
+        if bbox:
+            bbox = tuple(float(value) for value in bbox.split(','))
+            if len(bbox) != 4:
+                raise ValueError("bbox must be min_lat,min_lon,max_lat,max_lon")
+        region = request.args.get('region', type=int)
+        limit = min(request.args.get('limit', 1000, type=int), 10000)
+        offset = request.args.get('offset', 0, type=int)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    flights = get_store().filter_flights(
+        date_from=request.args.get('date_from'),
+        date_to=request.args.get('date_to'),
+        region_code=region,
+        bbox=bbox,
+        point=request.args.get('point', 'takeoff'),
+        limit=limit,
+        offset=offset,
+    )
+    return jsonify(flights)
 
+# Other endpoints (not implemented)
 @app.route('/flights/avg_duration', methods=['GET'])
 def avg_duration():
     pass  # Compute average flight duration
@@ -1,13 +1,101 @@
 
+import multiprocessing
 import os
 
 # Paths (relative to project root)
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(ROOT_DIR, 'data')
+FRONTEND_STATIC_DIR = os.path.join(ROOT_DIR, '../frontend/public')
+# Workbooks with derived data, and published frontend data; scratch runs (the load test) point both elsewhere
+DATA_DIR = os.environ.get('LCT_DATA_DIR', os.path.join(ROOT_DIR, 'data'))
+PUBLISH_DIR = os.environ.get('LCT_PUBLISH_DIR', FRONTEND_STATIC_DIR)
 SHAPEFILE_PATH = os.path.join(ROOT_DIR, 'regions_shapefile', 'regions_shapefile')
-FRONTEND_JSON_PATH = os.path.join(ROOT_DIR, '../frontend/public', 'all_data_from_back.json')
-FRONTEND_STATS_PATH = os.path.join(ROOT_DIR, '../frontend/public', 'flight_statistics.json')
+FRONTEND_JSON_PATH = os.path.join(PUBLISH_DIR, 'all_data_from_back.json')
+FRONTEND_STATS_PATH = os.path.join(PUBLISH_DIR, 'flight_statistics.json')
 
 # Required fields for validation
 REQUIRED_FIELDS = ['takeoff_coordinates', 'landing_coordinates']
 
+# Optional SQLite storage: flights are ingested incrementally instead of rewriting the JSON export
+USE_SQLITE_STORAGE = os.environ.get('LCT_USE_SQLITE', '0') == '1'
+SQLITE_DB_PATH = os.path.join(DATA_DIR, 'flights.sqlite3')
+SQLITE_BATCH_SIZE = 5000
+# Seconds a connection waits for another writer (threads, gunicorn workers, the CLI) before giving up
+SQLITE_BUSY_TIMEOUT = 30
+
+# Takeoff density aggregates (geohash precisions, coarse to fine)
+DENSITY_PATH = os.path.join(DATA_DIR, 'density.npz')
+DENSITY_RESOLUTIONS = [2, 3, 4, 5, 6]
+
+# Streaming pipeline: flights pass through parse -> locate -> aggregate -> write in bounded chunks
+USE_STREAMING_PIPELINE = os.environ.get('LCT_STREAMING', '0') == '1'
+PIPELINE_CHUNK_SIZE = 5000
+FRONTEND_NDJSON_PATH = os.path.join(PUBLISH_DIR, 'all_data_from_back.ndjson')
+
+# SHR/DEP/ARR correlation: partial flights older than the window (days) or beyond the cap are emitted as is.
+# The window is counted from the median date of the last CORRELATION_WATERMARK_SAMPLES messages
+CORRELATION_WINDOW_DAYS = 2
+CORRELATION_MAX_PENDING = 100000
+CORRELATION_WATERMARK_SAMPLES = 1001
+
+# Canonical region registry (codes, official names, aliases) the shapefile is joined to
+REGIONS_REGISTRY_PATH = os.path.join(ROOT_DIR, 'regions_registry.json')
+
+# Parallel region location: large point arrays are split into chunks for a process pool
+LOCATE_WORKERS = int(os.environ.get('LCT_LOCATE_WORKERS', os.cpu_count() or 1))
+LOCATE_PARALLEL_MIN_POINTS = 1000000
+LOCATE_CHUNK_SIZE = 100000
+# Pool processes are started fresh (forkserver, or spawn where it is missing): forking a process that runs
+# threads (gunicorn workers, upload jobs) can copy locks held by those threads and hang the child
+LOCATE_START_METHOD = os.environ.get('LCT_LOCATE_START_METHOD', 'forkserver'
+                                     if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+# Published frontend data: compact JSON plus pre-compressed sidecars served by Accept-Encoding
+PUBLISH_GZIP_LEVEL = 6
+PUBLISH_BROTLI_QUALITY = 9
+
+# Regional activity rating: geometry metrics are computed once in an equal-area projection and cached
+REGION_METRICS_PATH = os.path.join(DATA_DIR, 'region_metrics.json')
+REGION_RATING_PATH = os.path.join(PUBLISH_DIR, 'region_rating.json')
+EQUAL_AREA_CRS = "+proj=aea +lat_0=0 +lon_0=105 +lat_1=52 +lat_2=64 +datum=WGS84 +units=m +no_defs"
+RATING_WEIGHTS = {'flights': 0.5, 'flight_hours': 0.3, 'unique_uav_types': 0.2}
+MAX_FLIGHT_HOURS = 24
+
+# Flight intervals (region, takeoff, landing) for the peak concurrency sweep
+FLIGHT_INTERVALS_PATH = os.path.join(DATA_DIR, 'flight_intervals.npz')
+
+# Proximity queries: k-d tree over unit-sphere takeoff/landing points, rebuilt at ingest
+FLIGHT_TREE_PATH = os.path.join(DATA_DIR, 'flight_tree.npz')
+FLIGHT_TREE_LEAF_SIZE = 64
+NEAR_MAX_RADIUS_KM = 500
+NEAREST_MAX_POINTS = 1000
+NEAREST_MAX_COUNT = 100
+
+# Points outside every polygon (coast, border gaps, rounding) snap to the nearest region within this distance
+LOCATE_SNAP_KM = float(os.environ.get('LCT_LOCATE_SNAP_KM', 5))
+LOCATE_REPORT_PATH = os.path.join(DATA_DIR, 'locate_report.json')
+
+# Uploads: multipart bodies are streamed to disk in chunks, hashed on the fly and deduplicated before parsing
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_UNZIPPED_BYTES = 4 * 1024 ** 3
+
+# Upload preview: region shares are first estimated from a growing random sample of rows, then computed exactly
+PREVIEW_FIRST_BATCH = 2000
+PREVIEW_MAX_FRACTION = 0.2
+PREVIEW_TARGET_HALF_WIDTH = 0.5
+PREVIEW_Z = 1.96
+
+# gunicorn (gunicorn.conf.py next to this file): every SSE client holds a worker thread for the whole stream,
+# so a threaded worker class is required; sync workers are refused at startup
+GUNICORN_WORKER_CLASS = 'gthread'
+GUNICORN_THREADS = 8
+GUNICORN_TIMEOUT = 30
+
+# Statistics feed: every publish appends a versioned delta; SSE clients resume from their last version
+STATS_VERSIONS_PATH = os.path.join(DATA_DIR, 'stats_versions.json')
+STATS_DELTA_HISTORY = 100
+SSE_POLL_SECONDS = 0.5
+SSE_HEARTBEAT_SECONDS = 15
+# Streams are closed well before the gunicorn worker timeout; EventSource reconnects by itself with Last-Event-ID
+SSE_MAX_STREAM_SECONDS = GUNICORN_TIMEOUT - 5
+SSE_RETRY_MS = 3000
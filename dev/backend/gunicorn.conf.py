@@ -0,0 +1,18 @@
+
+import sys
+from gunicorn.workers.sync import SyncWorker
+from dev.backend.config import GUNICORN_WORKER_CLASS, GUNICORN_THREADS, GUNICORN_TIMEOUT, SSE_MAX_STREAM_SECONDS
+
+# Run from the project root: gunicorn -c dev/backend/gunicorn.conf.py dev.backend.app:app
+worker_class = GUNICORN_WORKER_CLASS
+threads = GUNICORN_THREADS
+timeout = GUNICORN_TIMEOUT
+
+
+def on_starting(server):
+    """Отказывается стартовать с настройками, при которых SSE-потоки блокируют или убивают воркеры"""
+    # A sync worker serves one request at a time: a single /flights_percent/stream client would block it
+    if issubclass(server.worker_class, SyncWorker):
+        sys.exit("gunicorn: /flights_percent/stream needs a threaded or async worker class (gthread, gevent)")
+    if 0 < server.cfg.timeout <= SSE_MAX_STREAM_SECONDS:
+        sys.exit(f"gunicorn: --timeout must exceed SSE_MAX_STREAM_SECONDS ({SSE_MAX_STREAM_SECONDS} s)")
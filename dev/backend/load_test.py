@@ -0,0 +1,331 @@
+
+import argparse
+import http.client
+import io
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from typing import Dict, List, Optional, Tuple
+
+# Run from anywhere: gunicorn imports dev.backend.app relative to the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_SEED_DIR = os.path.join(PROJECT_ROOT, "dev", "backend", "data")
+
+# name, method, path, weight
+SCENARIOS = [
+    ("flights_percent", "GET", "/flights_percent", 10),
+    ("flights_filter", "GET", "/flights/filter?limit=100", 4),
+    ("flights_density", "GET", "/flights/density?res=4", 4),
+    ("flights_peak_concurrency", "GET", "/flights/peak_concurrency?window=day", 4),
+    ("flights_near", "GET", "/flights/near?lat=55.75&lon=37.62&radius_km=100&limit=100", 4),
+    ("flights_nearest", "POST", "/flights/nearest", 2),
+    ("regions_rating", "GET", "/regions/rating?limit=20", 4),
+    ("stats_stream", "GET", "/flights_percent/stream", 1),
+    ("static_index", "GET", "/index.html", 3),
+    ("static_js", "GET", "/main.js", 3),
+    ("static_stats", "GET", "/flight_statistics.json", 3),
+]
+# JSON bodies of POST scenarios other than uploads
+JSON_BODIES = {
+    "flights_nearest": {"points": [{"lat": 55.75, "lon": 37.62}, {"lat": 59.94, "lon": 30.31},
+                                   {"lat": 56.84, "lon": 60.6}], "n": 5},
+}
+# SSE streams never end by themselves: the client reads up to the first event (the snapshot) and hangs up.
+# The server only notices on a later write, so each stream still holds a worker thread up to SSE_MAX_STREAM_SECONDS
+STREAM_SCENARIOS = {"stats_stream"}
+STREAM_MAX_BYTES = 1024 * 1024
+# Every "upload" sends new content, so it is parsed; "upload_duplicate" repeats one body and hits the hash check
+UPLOAD_SCENARIOS = [("upload", "POST", "/upload", 1), ("upload_duplicate", "POST", "/upload", 1)]
+
+
+def parse_configs(value: str) -> List[Tuple[int, int]]:
+    """Разбирает список конфигураций gunicorn вида '1x1,2x4' (workers x threads)"""
+    configs = []
+    for item in value.split(','):
+        workers, threads = item.lower().split('x')
+        configs.append((int(workers), int(threads)))
+    return configs
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest rank: the smallest value with at least q% of the samples at or below it
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def unique_workbook(content: bytes) -> bytes:
+    """Копия книги xlsx с другим хешем: в архив добавляется случайная часть, листы не меняются"""
+    buffer = io.BytesIO(content)
+    with zipfile.ZipFile(buffer, 'a') as workbook:
+        workbook.writestr(f"customXml/load-test-{uuid.uuid4().hex}.xml", "<loadTest/>")
+    return buffer.getvalue()
+
+
+def multipart_body(filename: str, content: bytes) -> Tuple[bytes, str]:
+    """Собирает тело multipart/form-data с одним файлом в поле files"""
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\n"
+            f"Content-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    return head + content + f"\r\n--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+
+def scratch_env(directory: str) -> Dict[str, str]:
+    """Окружение, в котором приложение читает и публикует данные только внутри directory"""
+    return dict(os.environ, LCT_DATA_DIR=os.path.join(directory, "data"),
+                LCT_PUBLISH_DIR=os.path.join(directory, "public"))
+
+
+def seed_template(seed_files: List[str]) -> str:
+    """Готовит исходное состояние прогонов: копии книг и опубликованные по ним данные (main.py)"""
+    template = tempfile.mkdtemp(prefix="lct-load-seed-")
+    os.makedirs(os.path.join(template, "data"))
+    os.makedirs(os.path.join(template, "public"))
+    for path in seed_files:
+        shutil.copy(path, os.path.join(template, "data"))
+    subprocess.run([sys.executable, "-m", "dev.backend.main"], cwd=PROJECT_ROOT, env=scratch_env(template),
+                   check=True, stdout=subprocess.DEVNULL)
+    return template
+
+
+def read_first_event(response: http.client.HTTPResponse, max_bytes: int = STREAM_MAX_BYTES) -> None:
+    """Читает поток Server-Sent Events до первой строки data: (не больше max_bytes)"""
+    read = 0
+    while read < max_bytes:
+        line = response.readline(max_bytes - read)
+        if not line or line.startswith(b"data:"):
+            return
+        read += len(line)
+
+
+class GunicornServer:
+    """Запускает app.py под gunicorn с заданным числом процессов и потоков (класс воркеров из gunicorn.conf.py)"""
+
+    def __init__(self, port: int, workers: int, threads: int, timeout: int, env: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.env = env
+        self.command = [sys.executable, "-m", "gunicorn", "dev.backend.app:app",
+                        "--config", os.path.join("dev", "backend", "gunicorn.conf.py"),
+                        "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+                        "--threads", str(threads), "--timeout", str(timeout), "--log-level", "warning"]
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> 'GunicornServer':
+        self.process = subprocess.Popen(self.command, cwd=PROJECT_ROOT, env=self.env)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+                conn.request("GET", "/flights_percent")
+                conn.getresponse().read()
+                conn.close()
+                return self
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError("gunicorn exited during startup")
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("gunicorn did not start in 30 s")
+
+    def __exit__(self, *exc) -> None:
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+
+class LoadGenerator:
+    """Закрытый цикл нагрузки: concurrency потоков шлют запросы до истечения duration"""
+
+    def __init__(self, port: int, scenarios: List[Tuple], concurrency: int, duration: float,
+                 upload_file: Optional[str] = None, timeout: float = 120):
+        self.port = port
+        self.scenarios = scenarios
+        self.weights = [scenario[3] for scenario in scenarios]
+        self.concurrency = concurrency
+        self.duration = duration
+        self.timeout = timeout
+        self.upload_name = os.path.basename(upload_file) if upload_file else None
+        self.upload_content = None
+        if upload_file:
+            with open(upload_file, 'rb') as f:
+                self.upload_content = f.read()
+        self.duplicate_upload = (multipart_body(self.upload_name, self.upload_content)
+                                 if self.upload_content is not None else None)
+        self.samples: Dict[str, List[float]] = {scenario[0]: [] for scenario in scenarios}
+        self.errors: Dict[str, int] = {scenario[0]: 0 for scenario in scenarios}
+        self.lock = threading.Lock()
+
+    def _request(self, method: str, path: str, body: Optional[Tuple[bytes, str]] = None,
+                 stream: bool = False) -> int:
+        """Выполняет один запрос и читает ответ: полностью, а поток событий - до первого события"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        try:
+            if body is not None:
+                content, content_type = body
+                conn.request(method, path, body=content, headers={"Content-Type": content_type})
+            else:
+                conn.request(method, path, headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            if stream and response.status == 200:
+                read_first_event(response)
+            else:
+                response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    def _body(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """Тело запроса сценария (None для GET)"""
+        if name == "upload":
+            # Built before the clock starts: only the server's work is measured
+            return multipart_body(self.upload_name, unique_workbook(self.upload_content))
+        if name == "upload_duplicate":
+            return self.duplicate_upload
+        if name in JSON_BODIES:
+            return json.dumps(JSON_BODIES[name]).encode(), "application/json"
+        return None
+
+    def probe(self) -> List[str]:
+        """Убирает сценарии, отключенные в текущей конфигурации (501), чтобы не считать их ошибками"""
+        disabled = [scenario[0] for scenario in self.scenarios
+                    if scenario[1] == "GET"
+                    and self._request(scenario[1], scenario[2], stream=scenario[0] in STREAM_SCENARIOS) == 501]
+        self.scenarios = [scenario for scenario in self.scenarios if scenario[0] not in disabled]
+        self.weights = [scenario[3] for scenario in self.scenarios]
+        for name in disabled:
+            del self.samples[name], self.errors[name]
+        return disabled
+
+    def _worker(self, seed: int, deadline: float) -> None:
+        rng = random.Random(seed)
+        while time.time() < deadline:
+            name, method, path, _ = rng.choices(self.scenarios, weights=self.weights)[0]
+            body = self._body(name)
+            start = time.perf_counter()
+            try:
+                status = self._request(method, path, body, stream=name in STREAM_SCENARIOS)
+                ok = status < 500
+            except (OSError, http.client.HTTPException):
+                # Truncated bodies count too: they show files being rewritten under readers
+                ok = False
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.samples[name].append(elapsed)
+                if not ok:
+                    self.errors[name] += 1
+
+    def run(self) -> Dict[str, Dict[str, float]]:
+        """Запускает нагрузку и возвращает метрики по эндпоинтам"""
+        deadline = time.time() + self.duration
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for future in [pool.submit(self._worker, seed, deadline) for seed in range(self.concurrency)]:
+                future.result()
+        wall = time.perf_counter() - started
+
+        report = {}
+        for name, latencies in self.samples.items():
+            report[name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "rps": len(latencies) / wall if wall else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+            }
+        return report
+
+
+def print_report(config: str, report: Dict[str, Dict[str, float]]) -> None:
+    """Печатает таблицу метрик для одной конфигурации"""
+    print(f"\n=== gunicorn {config} ===")
+    print(f"{'endpoint':<26}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report.items():
+        print(f"{name:<26}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def compare_with_baseline(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Находит эндпоинты, у которых p95 вырос больше чем в tolerance раз относительно базового прогона"""
+    regressions = []
+    for config, report in results.items():
+        for name, row in report.items():
+            previous = baseline.get(config, {}).get(name)
+            if previous and previous["p95_ms"] > 0 and row["p95_ms"] > previous["p95_ms"] * tolerance:
+                regressions.append(f"{config} {name}: p95 {previous['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование Flask-приложения под gunicorn")
+    parser.add_argument("--configs", default="1x1,2x4,4x8", help="workers x threads, через запятую")
+    parser.add_argument("--concurrency", type=int, default=16, help="число одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=20, help="длительность прогона одной конфигурации, с")
+    parser.add_argument("--port", type=int, default=3100)
+    parser.add_argument("--upload-file", help="xlsx для сценария одновременных /upload (без него сценарий пропускается)")
+    parser.add_argument("--seed-dir", default=DEFAULT_SEED_DIR,
+                        help="книги, с которых начинается каждая конфигурация (копируются, исходные не меняются)")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для поиска регрессий")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="допустимый рост p95 относительно baseline")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS + (UPLOAD_SCENARIOS if args.upload_file else [])
+    seed_files = sorted(glob(os.path.join(args.seed_dir, "*.xlsx")) + glob(os.path.join(args.seed_dir, "*.xls")))
+    if args.upload_file:
+        # The upload file is part of the seed, so "upload_duplicate" is a duplicate from the first request
+        seed_files.append(args.upload_file)
+    # Uploads store workbooks and republish data: every configuration works on a fresh copy of one seeded state,
+    # so the project data stays untouched and the configurations start from the same point
+    template = seed_template(seed_files)
+    results = {}
+    try:
+        for workers, threads in parse_configs(args.configs):
+            config = f"{workers}x{threads}"
+            scratch = tempfile.mkdtemp(prefix="lct-load-")
+            try:
+                shutil.copytree(template, scratch, dirs_exist_ok=True)
+                with GunicornServer(args.port, workers, threads, timeout=300, env=scratch_env(scratch)):
+                    generator = LoadGenerator(args.port, scenarios, args.concurrency, args.duration, args.upload_file)
+                    for name in generator.probe():
+                        print(f"Scenario {name} skipped: endpoint disabled (501)")
+                    results[config] = generator.run()
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+            print_report(config, results[config])
+    finally:
+        shutil.rmtree(template, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,25 @@
 
 import os
-import json
-from dev.backend.config import DATA_DIR, FRONTEND_JSON_PATH, FRONTEND_STATS_PATH
-from dev.backend.src.parsers.excel_parser import ExcelParser
+import sys
+from dev.backend.config import DATA_DIR, USE_SQLITE_STORAGE, SQLITE_DB_PATH, SQLITE_BATCH_SIZE
 from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
-from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
+from dev.backend.src.services.ingest_service import reattribute_store
+from dev.backend.src.services.processing_service import process_excel_files, write_statistics
+from dev.backend.src.storage.flight_store import FlightStore
 import glob
 
 
 def main():
-    # Initialize parsers and analyzer
-    excel_parser = ExcelParser()
-    uav_parser = UAVFlightParser()
-    analyzer = RegionAnalyzer()
+    if USE_SQLITE_STORAGE and "--reattribute" in sys.argv:
+        # Full historical re-attribution of stored flights, in parallel for large stores
+        store = FlightStore(SQLITE_DB_PATH, SQLITE_BATCH_SIZE)
+        write_statistics(reattribute_store(store, RegionAnalyzer()))
+        return
 
     # Process Excel files
     excel_files = glob.glob(os.path.join(DATA_DIR, "*.xlsx")) + glob.glob(os.path.join(DATA_DIR, "*.xls"))
-    all_flights = []
-
-    for file_path in excel_files:
-        print(f"Processing file: {file_path}")
-        flights = excel_parser.parse_excel(file_path, uav_parser)
-        all_flights.extend(flights)
-
-    # Save flight data to JSON
-    os.makedirs(os.path.dirname(FRONTEND_JSON_PATH), exist_ok=True)
-    with open(FRONTEND_JSON_PATH, 'w', encoding='utf-8') as f:
-        json.dump([flight.to_dict() for flight in all_flights], f, ensure_ascii=False, indent=4)
-    print(f"Output written to {FRONTEND_JSON_PATH}")
-
-    # Compute and save flight statistics
-    stats = analyzer.compute_flight_statistics(all_flights)
-    os.makedirs(os.path.dirname(FRONTEND_STATS_PATH), exist_ok=True)
-    with open(FRONTEND_STATS_PATH, 'w', encoding='utf-8') as f:
-        json.dump(stats, f, ensure_ascii=False, indent=4)
-    print(f"Statistics written to {FRONTEND_STATS_PATH}")
+    process_excel_files(excel_files)
 
 
 if __name__ == "__main__":
     main()
-
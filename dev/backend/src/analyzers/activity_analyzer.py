@@ -0,0 +1,133 @@
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dev.backend.config import RATING_WEIGHTS
+from dev.backend.src.analyzers.concurrency_analyzer import ConcurrencyAnalyzer
+from dev.backend.src.analyzers.flight_deduplicator import FlightDeduplicator
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.entities.flight import FlightData
+
+RATING_METRICS = ['flights', 'flight_hours', 'unique_uav_types']
+
+
+class RegionActivityAccumulator:
+    """Накапливает по регионам число полетов, летные часы, типы БВС и интервалы полетов по мере прохождения"""
+
+    def __init__(self, analyzer: RegionAnalyzer, deduplicator: Optional[FlightDeduplicator] = None):
+        self.analyzer = analyzer
+        # Shared with the other accumulators; records it later supersedes are dropped when results are built
+        self.deduplicator = deduplicator
+        # One entry per selected record (slot): int16 code, hours (NaN if unknown), UAV type index (-1 if none)
+        self.code_chunks: List[np.ndarray] = []
+        self.hour_chunks: List[np.ndarray] = []
+        self.type_chunks: List[np.ndarray] = []
+        self.uav_types: Dict[str, int] = {}
+        # Intervals are kept as compact arrays per chunk (slot, int16 code, int64 minutes), not Python objects per flight
+        self.interval_chunks: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        self.slots = 0
+
+    def add(self, flights: List[FlightData], codes: np.ndarray) -> None:
+        """Учитывает порцию отобранных полетов (FlightDeduplicator.select) с уже найденными кодами регионов"""
+        hours = np.full(len(flights), np.nan, dtype=np.float64)
+        types = np.full(len(flights), -1, dtype=np.int32)
+        interval_slots: List[int] = []
+        interval_codes: List[int] = []
+        flight_intervals: List[Tuple[datetime, datetime]] = []
+        for i, (flight, code) in enumerate(zip(flights, codes.tolist())):
+            if not code:
+                continue
+            interval = flight.get_flight_interval()
+            if interval is not None:
+                hours[i] = (interval[1] - interval[0]).total_seconds() / 3600
+                interval_slots.append(self.slots + i)
+                interval_codes.append(code)
+                flight_intervals.append(interval)
+            if flight.uav_type:
+                types[i] = self.uav_types.setdefault(flight.uav_type, len(self.uav_types))
+        self.code_chunks.append(np.asarray(codes, dtype=np.int16))
+        self.hour_chunks.append(hours)
+        self.type_chunks.append(types)
+        if interval_codes:
+            self.interval_chunks.append((np.asarray(interval_slots, dtype=np.int64),
+                                         *ConcurrencyAnalyzer.intervals(interval_codes, flight_intervals)))
+        self.slots += len(flights)
+
+    def _valid(self) -> np.ndarray:
+        """Маска записей, оставшихся после дедупликации"""
+        if self.deduplicator is None:
+            return np.ones(self.slots, dtype=bool)
+        return self.deduplicator.valid()[:self.slots]
+
+    def intervals(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Возвращает интервалы полетов (коды, взлеты, посадки) для анализа пиковой загрузки"""
+        if not self.interval_chunks:
+            return ConcurrencyAnalyzer.intervals([], [])
+        slots, codes, start, end = (np.concatenate(arrays) for arrays in zip(*self.interval_chunks))
+        keep = self._valid()[slots]
+        return codes[keep], start[keep], end[keep]
+
+    def rating(self) -> Dict:
+        """Возвращает рейтинг по накопленным значениям"""
+        size = self.analyzer.registry.size
+        if not self.code_chunks:
+            return activity_rating(self.analyzer, *(np.zeros(size, dtype=dtype)
+                                                    for dtype in (np.int64, np.float64, np.int64)))
+        keep = self._valid()
+        codes = np.concatenate(self.code_chunks)[keep].astype(np.int64)
+        hours = np.concatenate(self.hour_chunks)[keep]
+        types = np.concatenate(self.type_chunks)[keep]
+        located = codes > 0
+        flights = np.bincount(codes[located], minlength=size)
+        timed = located & ~np.isnan(hours)
+        flight_hours = np.bincount(codes[timed], weights=hours[timed], minlength=size)
+        typed = located & (types >= 0)
+        pairs = np.unique(codes[typed] * max(len(self.uav_types), 1) + types[typed])
+        unique_uav_types = np.bincount(pairs // max(len(self.uav_types), 1), minlength=size)
+        return activity_rating(self.analyzer, flights, flight_hours, unique_uav_types)
+
+
+def activity_arrays(analyzer: RegionAnalyzer,
+                    rows: List[Tuple[int, int, float, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Преобразует строки (код, полеты, часы, типы БВС) из хранилища в массивы по кодам регионов"""
+    flights = np.zeros(analyzer.registry.size, dtype=np.int64)
+    flight_hours = np.zeros(analyzer.registry.size, dtype=np.float64)
+    unique_uav_types = np.zeros(analyzer.registry.size, dtype=np.int64)
+    for code, flight_count, hours, uav_count in rows:
+        if 0 < code < analyzer.registry.size:
+            flights[code], flight_hours[code], unique_uav_types[code] = flight_count, hours, uav_count
+    return flights, flight_hours, unique_uav_types
+
+
+def activity_rating(analyzer: RegionAnalyzer, flights: np.ndarray, flight_hours: np.ndarray,
+                    unique_uav_types: np.ndarray) -> Dict:
+    """Строит рейтинг регионов: показатели на 1000 км², нормированные на максимум и взвешенные по RATING_WEIGHTS"""
+    area = analyzer.region_area_km2
+    codes = np.flatnonzero(area > 0)
+    totals = {'flights': flights, 'flight_hours': flight_hours, 'unique_uav_types': unique_uav_types}
+    densities = {metric: totals[metric][codes] / area[codes] * 1000 for metric in RATING_METRICS}
+
+    score = np.zeros(len(codes), dtype=np.float64)
+    for metric, weight in RATING_WEIGHTS.items():
+        peak = densities[metric].max() if len(codes) else 0
+        if peak > 0:
+            score += weight * densities[metric] / peak
+    score *= 100 / sum(RATING_WEIGHTS.values())
+
+    regions = []
+    for rank, i in enumerate(np.lexsort((codes, -score)), start=1):
+        code = int(codes[i])
+        regions.append({
+            "rank": rank,
+            "code": code,
+            "name": analyzer.registry.name(code),
+            "score": round(float(score[i]), 3),
+            "area_km2": round(float(area[code]), 1),
+            "flights": int(flights[code]),
+            "flight_hours": round(float(flight_hours[code]), 2),
+            "unique_uav_types": int(unique_uav_types[code]),
+            "flights_per_1000_km2": float(densities['flights'][i]),
+            "flight_hours_per_1000_km2": float(densities['flight_hours'][i]),
+            "unique_uav_types_per_1000_km2": float(densities['unique_uav_types'][i]),
+        })
+    return {"weights": RATING_WEIGHTS, "regions": regions}
@@ -0,0 +1,126 @@
+
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Times are stored as minutes since the epoch (local time of the source messages)
+EPOCH = datetime(1970, 1, 1)
+# Window length in minutes and the offset that aligns windows (weeks start on Monday, the epoch was a Thursday)
+WINDOWS: Dict[str, Optional[Tuple[int, int]]] = {
+    'all': None,
+    'day': (1440, 0),
+    'week': (10080, 3 * 1440),
+}
+
+
+class ConcurrencyAnalyzer:
+    """Пиковое число одновременных полетов по регионам (сортировка событий взлета и посадки)"""
+
+    @staticmethod
+    def to_minutes(moment: datetime) -> int:
+        """Переводит время в минуты от начала эпохи"""
+        return int((moment - EPOCH).total_seconds() // 60)
+
+    @staticmethod
+    def from_minutes(minutes: int) -> str:
+        """Переводит минуты от начала эпохи в ISO-строку"""
+        return (EPOCH + timedelta(minutes=int(minutes))).isoformat(timespec='minutes')
+
+    @classmethod
+    def intervals(cls, codes: List[Optional[int]],
+                  intervals: List[Optional[Tuple[datetime, datetime]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Отбирает полеты с регионом и ненулевой длительностью; возвращает массивы кодов, взлетов и посадок"""
+        rows = [(code, cls.to_minutes(interval[0]), cls.to_minutes(interval[1]))
+                for code, interval in zip(codes, intervals) if code and interval is not None]
+        # Zero-length flights are never in the air together with anything
+        rows = [row for row in rows if row[2] > row[1]]
+        if not rows:
+            return np.empty(0, dtype=np.int16), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        array = np.asarray(rows, dtype=np.int64)
+        return array[:, 0].astype(np.int16), array[:, 1], array[:, 2]
+
+    @staticmethod
+    def save(path: str, codes: np.ndarray, start: np.ndarray, end: np.ndarray) -> None:
+        """Сохраняет интервалы полетов в npz (атомарная замена файла)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, code=codes.astype(np.int16), start=start.astype(np.int64), end=end.astype(np.int64))
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> Dict[str, np.ndarray]:
+        """Загружает интервалы полетов"""
+        with np.load(path) as data:
+            return {key: data[key] for key in ('code', 'start', 'end')}
+
+    @staticmethod
+    def split_by_window(codes: np.ndarray, start: np.ndarray, end: np.ndarray,
+                        window: Optional[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Разрезает интервалы по границам окон; возвращает коды, номера окон, начала и концы частей"""
+        if window is None:
+            return codes, np.zeros(len(codes), dtype=np.int64), start, end
+        length, offset = window
+        first = (start + offset) // length
+        # The end is exclusive: a flight landing exactly on a boundary stays in the earlier window
+        last = (end - 1 + offset) // length
+        pieces = last - first + 1
+        index = np.repeat(np.arange(len(codes)), pieces)
+        window_index = first[index] + (np.arange(len(index)) - np.repeat(np.cumsum(pieces) - pieces, pieces))
+        piece_start = np.maximum(start[index], window_index * length - offset)
+        piece_end = np.minimum(end[index], (window_index + 1) * length - offset)
+        return codes[index], window_index, piece_start, piece_end
+
+    @classmethod
+    def peaks(cls, codes: np.ndarray, start: np.ndarray, end: np.ndarray,
+              window: str = 'all') -> Dict[str, np.ndarray]:
+        """Для каждой пары (регион, окно) находит максимум одновременных полетов и момент его начала и конца"""
+        valid = end > start
+        codes, start, end = codes[valid], start[valid], end[valid]
+        codes, window_index, start, end = cls.split_by_window(codes, start, end, WINDOWS[window])
+        if len(codes) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return {"code": empty, "window": empty, "peak": empty, "peak_start": empty,
+                    "peak_end": empty, "flights": empty}
+
+        # One int64 key per (region, window); sorting it orders groups by region, then by window
+        base = window_index.min()
+        span = window_index.max() - base + 1
+        keys, group = np.unique(codes.astype(np.int64) * span + (window_index - base), return_inverse=True)
+
+        # Landings sort before takeoffs at the same minute: touching flights do not overlap
+        times = np.concatenate([start, end])
+        deltas = np.concatenate([np.ones(len(start), dtype=np.int64), -np.ones(len(end), dtype=np.int64)])
+        event_group = np.concatenate([group, group])
+        order = np.lexsort((deltas, times, event_group))
+        times, deltas, event_group = times[order], deltas[order], event_group[order]
+
+        # Every group nets to zero, so a single cumulative sum restarts at each group boundary.
+        # Only the count after the last event of a minute is real; landings first make earlier ones transient
+        in_air = np.cumsum(deltas)
+        last = np.r_[(event_group[1:] != event_group[:-1]) | (times[1:] != times[:-1]), True]
+        times, event_group, in_air = times[last], event_group[last], in_air[last]
+        boundaries = np.flatnonzero(np.r_[True, event_group[1:] != event_group[:-1]])
+        peak = np.maximum.reduceat(in_air, boundaries)
+
+        # The peak starts at the first minute reaching it and lasts until the count first drops below it
+        at_peak = np.flatnonzero(in_air == peak[event_group])
+        first = at_peak[np.unique(event_group[at_peak], return_index=True)[1]]
+        below = np.where(in_air < peak[event_group], np.arange(len(in_air)), len(in_air))
+        next_below = np.minimum.accumulate(below[::-1])[::-1]
+        return {
+            "code": keys // span,
+            "window": keys % span + base,
+            "peak": peak,
+            "peak_start": times[first],
+            "peak_end": times[next_below[first]],
+            "flights": np.bincount(group, minlength=len(peak)),
+        }
+
+    @classmethod
+    def window_bounds(cls, window: str, index: int) -> Tuple[Optional[str], Optional[str]]:
+        """Границы окна в ISO-формате"""
+        if WINDOWS[window] is None:
+            return None, None
+        length, offset = WINDOWS[window]
+        return cls.from_minutes(index * length - offset), cls.from_minutes((index + 1) * length - offset)
@@ -0,0 +1,138 @@
+
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from dev.backend.src.entities.flight import FlightData
+
+
+class DensityAnalyzer:
+    """Агрегирует плотность точек взлета по ячейкам geohash нескольких разрешений"""
+
+    BASE32 = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+
+    def __init__(self, resolutions: List[int]):
+        self.resolutions = sorted(resolutions)
+        self.cells: Dict[int, Dict[str, np.ndarray]] = {}
+
+    @staticmethod
+    def takeoff_points(flights: List[FlightData]) -> Tuple[np.ndarray, np.ndarray]:
+        """Извлекает координаты взлета в виде массивов (lat, lon)"""
+        points = [flight.takeoff_coordinates for flight in flights if flight.takeoff_coordinates]
+        if not points:
+            return np.empty(0), np.empty(0)
+        coords = np.asarray(points, dtype=np.float64)
+        return coords[:, 0], coords[:, 1]
+
+    @staticmethod
+    def _bits(resolution: int) -> Tuple[int, int]:
+        """Число бит широты и долготы для geohash заданной длины"""
+        total = resolution * 5
+        return total // 2, total - total // 2
+
+    @classmethod
+    def encode(cls, lat: np.ndarray, lon: np.ndarray, resolution: int) -> np.ndarray:
+        """Векторно вычисляет целочисленный код geohash (биты долготы и широты чередуются)"""
+        lat_bits, lon_bits = cls._bits(resolution)
+        lat_idx = np.clip(((lat + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+        lon_idx = np.clip(((lon + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+
+        code = np.zeros(lat.shape, dtype=np.int64)
+        # Geohash starts with a longitude bit, then alternates
+        for bit in range(resolution * 5):
+            if bit % 2 == 0:
+                value = (lon_idx >> (lon_bits - 1 - bit // 2)) & 1
+            else:
+                value = (lat_idx >> (lat_bits - 1 - bit // 2)) & 1
+            code = (code << 1) | value
+        return code
+
+    @classmethod
+    def decode_centers(cls, code: np.ndarray, resolution: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Возвращает центры ячеек (lat, lon) по целочисленным кодам"""
+        lat_bits, lon_bits = cls._bits(resolution)
+        lat_idx = np.zeros(code.shape, dtype=np.int64)
+        lon_idx = np.zeros(code.shape, dtype=np.int64)
+        total = resolution * 5
+        for bit in range(total):
+            value = (code >> (total - 1 - bit)) & 1
+            if bit % 2 == 0:
+                lon_idx = (lon_idx << 1) | value
+            else:
+                lat_idx = (lat_idx << 1) | value
+        lat = (lat_idx + 0.5) * (180.0 / (1 << lat_bits)) - 90.0
+        lon = (lon_idx + 0.5) * (360.0 / (1 << lon_bits)) - 180.0
+        return lat, lon
+
+    @classmethod
+    def to_geohash(cls, code: np.ndarray, resolution: int) -> List[str]:
+        """Преобразует целочисленные коды в строки geohash"""
+        chars = np.empty((len(code), resolution), dtype='<U1')
+        for i in range(resolution):
+            shift = 5 * (resolution - 1 - i)
+            chars[:, i] = cls.BASE32[(code >> shift) & 31]
+        return [''.join(row) for row in chars]
+
+    def compute(self, lat: np.ndarray, lon: np.ndarray) -> Dict[int, Dict[str, np.ndarray]]:
+        """Считает число точек в ячейках для каждого разрешения"""
+        self.cells = {}
+        self.update(lat, lon)
+        return self.cells
+
+    def update(self, lat: np.ndarray, lon: np.ndarray) -> None:
+        """Добавляет порцию точек к уже накопленным ячейкам (память ограничена числом ячеек)"""
+        for resolution in self.resolutions:
+            code = self.encode(lat, lon, resolution)
+            previous = self.cells.get(resolution)
+            if previous is not None:
+                # Merge with the cells seen so far: concatenate codes and sum counts per code
+                code = np.concatenate([previous["code"], code])
+                weights = np.concatenate([previous["count"], np.ones(len(code) - len(previous["code"]), dtype=np.int64)])
+            else:
+                weights = np.ones(len(code), dtype=np.int64)
+            unique_codes, inverse = np.unique(code, return_inverse=True)
+            counts = np.bincount(inverse.ravel(), weights=weights, minlength=len(unique_codes)).astype(np.int64)
+            cell_lat, cell_lon = self.decode_centers(unique_codes, resolution)
+            self.cells[resolution] = {
+                "code": unique_codes,
+                "count": counts,
+                "lat": cell_lat.astype(np.float32),
+                "lon": cell_lon.astype(np.float32),
+            }
+
+    def save(self, path: str) -> None:
+        """Сохраняет предрасчитанные массивы всех разрешений в один .npz"""
+        if not self.cells:
+            self.update(np.empty(0), np.empty(0))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {f"r{resolution}_{key}": value
+                  for resolution, cells in self.cells.items() for key, value in cells.items()}
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, resolutions=np.asarray(self.resolutions), **arrays)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path: str) -> Dict[int, Dict[str, np.ndarray]]:
+        """Загружает предрасчитанные массивы из .npz"""
+        with np.load(path) as data:
+            return {
+                int(resolution): {key: data[f"r{resolution}_{key}"] for key in ("code", "count", "lat", "lon")}
+                for resolution in data["resolutions"]
+            }
+
+    @classmethod
+    def query(cls, cells: Dict[int, Dict[str, np.ndarray]], resolution: int,
+              bbox: Optional[Tuple[float, float, float, float]] = None) -> Dict:
+        """Выбирает ячейки разрешения resolution, центры которых попадают в bbox (min_lat, min_lon, max_lat, max_lon)"""
+        level = cells[resolution]
+        mask = np.ones(len(level["code"]), dtype=bool)
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            mask = ((level["lat"] >= min_lat) & (level["lat"] <= max_lat) &
+                    (level["lon"] >= min_lon) & (level["lon"] <= max_lon))
+        return {
+            "resolution": resolution,
+            "geohash": cls.to_geohash(level["code"][mask], resolution),
+            "lat": level["lat"][mask].round(5).tolist(),
+            "lon": level["lon"][mask].round(5).tolist(),
+            "count": level["count"][mask].tolist(),
+        }
@@ -0,0 +1,54 @@
+
+from typing import Dict, Iterable, List
+import numpy as np
+from dev.backend.src.entities.flight import FlightData
+
+# Completeness stays below this bound, so a slot number and a score fit in one int
+SCORE_BASE = 16
+
+
+class FlightDeduplicator:
+    """Одна запись на идентификатор полета: из повторов остается самая полная, при равенстве - первая"""
+
+    def __init__(self):
+        # One instance per pass, shared by every accumulator of that pass
+        # Slot and score packed into one int: a single small object per flight instead of a tuple
+        self.best: Dict[str, int] = {}
+        self.slots = 0
+        self.superseded: List[np.ndarray] = []
+
+    def select(self, flights: Iterable[FlightData]) -> List[FlightData]:
+        """Отбирает полеты с координатами, которые встречены впервые или полнее выбранной ранее записи"""
+        # Selected flights take consecutive slots: accumulators keep per-slot arrays in the same order
+        # and drop superseded slots through valid() when the result is built
+        selected, superseded = [], []
+        for flight in flights:
+            flight_id = flight.flight_identification
+            if not flight_id or not (flight.get_takeoff_coordinates() or flight.get_landing_coordinates()):
+                continue
+            score = flight.completeness()
+            previous = self.best.get(flight_id)
+            if previous is not None:
+                if score <= previous % SCORE_BASE:
+                    continue
+                superseded.append(previous // SCORE_BASE)
+            self.best[flight_id] = self.slots * SCORE_BASE + score
+            self.slots += 1
+            selected.append(flight)
+        if superseded:
+            self.superseded.append(np.asarray(superseded, dtype=np.int64))
+        return selected
+
+    def valid(self) -> np.ndarray:
+        """Маска номеров отобранных записей, которые не вытеснены более полными"""
+        mask = np.ones(self.slots, dtype=bool)
+        for slots in self.superseded:
+            mask[slots] = False
+        return mask
+
+    @classmethod
+    def unique(cls, flights: Iterable[FlightData]) -> List[FlightData]:
+        """Самая полная запись каждого полета с координатами, в порядке отбора"""
+        deduplicator = cls()
+        selected = deduplicator.select(flights)
+        return [flight for flight, keep in zip(selected, deduplicator.valid()) if keep]
@@ -0,0 +1,152 @@
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+import numpy as np
+import shapely
+from dev.backend.config import LOCATE_START_METHOD
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer, locate_points
+
+
+Layout = Dict[str, Tuple[int, str, Tuple[int, ...]]]
+
+
+class SharedArrays:
+    """Набор numpy-массивов в одном блоке разделяемой памяти"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.layout: Layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            offset = (offset + 7) // 8 * 8
+            self.layout[key] = (offset, array.dtype.str, array.shape)
+            offset += array.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, array in arrays.items():
+            self.view(self.shm, self.layout, key)[...] = array
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @staticmethod
+    def view(shm: shared_memory.SharedMemory, layout: Layout, key: str) -> np.ndarray:
+        """Массив поверх разделяемой памяти (без копирования)"""
+        offset, dtype, shape = layout[key]
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+    def release(self) -> None:
+        """Освобождает блок (вызывается владельцем)"""
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Per-worker state: the geometry block is attached once, the point blocks once per locate() call
+_worker: Dict = {}
+
+
+def _init_worker(geometry_name: str, geometry_layout: Layout) -> None:
+    """Инициализация процесса: геометрии читаются из разделяемой памяти, индекс строится один раз"""
+    shm = shared_memory.SharedMemory(name=geometry_name)
+    wkb = SharedArrays.view(shm, geometry_layout, "wkb")
+    offsets = SharedArrays.view(shm, geometry_layout, "offsets")
+    geometries = shapely.from_wkb([bytes(wkb[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)])
+    _worker["geometry_shm"] = shm
+    _worker["codes"] = SharedArrays.view(shm, geometry_layout, "codes")
+    _worker["tree"] = shapely.STRtree(geometries)
+    _worker["points"] = (None, None)
+
+
+def _locate_chunk(points_name: str, points_layout: Layout, start: int, stop: int,
+                  snap_km: float) -> Dict[str, int]:
+    """Определяет регионы для точек [start, stop) и пишет коды прямо в разделяемый результат; возвращает счетчики"""
+    name, shm = _worker["points"]
+    if name != points_name:
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name=points_name)
+        _worker["points"] = (points_name, shm)
+    lat = SharedArrays.view(shm, points_layout, "lat")
+    lon = SharedArrays.view(shm, points_layout, "lon")
+    out = SharedArrays.view(shm, points_layout, "codes")
+    report = RegionAnalyzer.empty_report()
+    out[start:stop] = locate_points(_worker["tree"], _worker["codes"], lat[start:stop], lon[start:stop],
+                                    snap_km, report)
+    return report
+
+
+class ParallelRegionLocator:
+    """Многопроцессное определение регионов для больших массивов точек (пул живет до close)"""
+
+    def __init__(self, analyzer: RegionAnalyzer, workers: Optional[int] = None,
+                 chunk_size: int = 100000, tile_degrees: float = 1.0, snap_km: float = 0.0,
+                 start_method: str = LOCATE_START_METHOD):
+        self.analyzer = analyzer
+        self.snap_km = snap_km
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.tile_degrees = tile_degrees
+        wkb = shapely.to_wkb(analyzer.gdf.geometry.values)
+        offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in wkb])
+        self.geometry = SharedArrays({
+            "wkb": np.frombuffer(b"".join(wkb), dtype=np.uint8),
+            "offsets": offsets,
+            "codes": analyzer.geometry_codes,
+        })
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.geometry.name, self.geometry.layout),
+        )
+
+    def spatial_order(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Порядок точек по тайлам сетки, чтобы порция затрагивала мало полигонов"""
+        tile_lat = np.floor(lat / self.tile_degrees).astype(np.int64)
+        tile_lon = np.floor(lon / self.tile_degrees).astype(np.int64)
+        return np.lexsort((tile_lon, tile_lat))
+
+    def locate(self, lat: np.ndarray, lon: np.ndarray, spatial_sort: bool = True,
+               report: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """Возвращает коды регионов, совпадающие с RegionAnalyzer.locate"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        order = self.spatial_order(lat, lon) if spatial_sort else None
+        if order is not None:
+            lat, lon = lat[order], lon[order]
+
+        points = SharedArrays({"lat": lat, "lon": lon, "codes": np.zeros(len(lat), dtype=np.int16)})
+        try:
+            futures = [
+                self.pool.submit(_locate_chunk, points.name, points.layout, start,
+                                 min(start + self.chunk_size, len(lat)), self.snap_km)
+                for start in range(0, len(lat), self.chunk_size)
+            ]
+            for future in futures:
+                chunk_report = future.result()
+                if report is not None:
+                    for key, value in chunk_report.items():
+                        report[key] += value
+            codes = SharedArrays.view(points.shm, points.layout, "codes").copy()
+        finally:
+            points.release()
+
+        if order is None:
+            return codes
+        result = np.empty_like(codes)
+        result[order] = codes
+        return result
+
+    def close(self) -> None:
+        """Останавливает процессы и освобождает разделяемую память"""
+        self.pool.shutdown()
+        self.geometry.release()
+
+    def __enter__(self) -> 'ParallelRegionLocator':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,271 @@
+
+import heapq
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dev.backend.src.analyzers.flight_deduplicator import FlightDeduplicator
+from dev.backend.src.entities.flight import FlightData
+
+EARTH_RADIUS_KM = 6371.0088
+TAKEOFF, LANDING = 0, 1
+POINT_KINDS = ['takeoff', 'landing']
+
+
+class SphericalKDTree:
+    """k-d дерево по точкам на единичной сфере (x, y, z): поиск в радиусе и ближайших соседей"""
+
+    def __init__(self, xyz: np.ndarray, order: np.ndarray, lo: np.ndarray, hi: np.ndarray,
+                 start: np.ndarray, stop: np.ndarray, left: np.ndarray, right: np.ndarray):
+        # xyz is stored in tree order; order maps tree positions back to the original point indices
+        self.xyz = xyz
+        self.order = order
+        self.lo, self.hi = lo, hi
+        self.start, self.stop = start, stop
+        self.left, self.right = left, right
+
+    @staticmethod
+    def to_unit(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        """Переводит широту и долготу (градусы) в единичные векторы"""
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+    @staticmethod
+    def chord_from_km(distance_km: float) -> float:
+        """Длина хорды единичной сферы для расстояния по дуге"""
+        return 2 * np.sin(min(distance_km / EARTH_RADIUS_KM, np.pi) / 2)
+
+    @staticmethod
+    def km_from_chord(chord: np.ndarray) -> np.ndarray:
+        """Расстояние по дуге (км) для длины хорды"""
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+    @classmethod
+    def build(cls, lat: np.ndarray, lon: np.ndarray, leaf_size: int = 64) -> 'SphericalKDTree':
+        """Строит дерево: узел делится по медиане вдоль самой длинной стороны своего габарита"""
+        xyz = cls.to_unit(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64))
+        order = np.arange(len(xyz), dtype=np.int64)
+        lo, hi, start, stop, left, right = [], [], [], [], [], []
+
+        def add_node(node_start: int, node_stop: int) -> int:
+            points = xyz[order[node_start:node_stop]]
+            lo.append(points.min(axis=0) if len(points) else np.zeros(3))
+            hi.append(points.max(axis=0) if len(points) else np.zeros(3))
+            start.append(node_start)
+            stop.append(node_stop)
+            left.append(-1)
+            right.append(-1)
+            return len(start) - 1
+
+        stack = [add_node(0, len(xyz))]
+        while stack:
+            node = stack.pop()
+            node_start, node_stop = start[node], stop[node]
+            if node_stop - node_start <= leaf_size:
+                continue
+            axis = int(np.argmax(hi[node] - lo[node]))
+            middle = (node_start + node_stop) // 2
+            segment = order[node_start:node_stop]
+            order[node_start:node_stop] = segment[np.argpartition(xyz[segment, axis], middle - node_start)]
+            left[node] = add_node(node_start, middle)
+            right[node] = add_node(middle, node_stop)
+            stack.extend((left[node], right[node]))
+
+        return cls(xyz[order], order, np.array(lo), np.array(hi), np.array(start, dtype=np.int64),
+                   np.array(stop, dtype=np.int64), np.array(left, dtype=np.int64), np.array(right, dtype=np.int64))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Массивы дерева для сохранения"""
+        return {"tree_xyz": self.xyz, "tree_order": self.order, "tree_lo": self.lo, "tree_hi": self.hi,
+                "tree_start": self.start, "tree_stop": self.stop, "tree_left": self.left, "tree_right": self.right}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'SphericalKDTree':
+        """Восстанавливает дерево из сохраненных массивов"""
+        return cls(*(arrays[f"tree_{key}"] for key in ('xyz', 'order', 'lo', 'hi', 'start', 'stop', 'left', 'right')))
+
+    def _box_distance(self, node: int, point: np.ndarray) -> float:
+        """Минимальное расстояние (хорда) от точки до габарита узла"""
+        gap = np.maximum(np.maximum(self.lo[node] - point, point - self.hi[node]), 0)
+        return float(np.sqrt(gap @ gap))
+
+    def query_radius(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Индексы точек в радиусе и расстояния до них (км), по возрастанию расстояния"""
+        point = self.to_unit(np.array([lat]), np.array([lon]))[0]
+        chord = self.chord_from_km(radius_km)
+        found, distances = [], []
+        stack = [0] if len(self.start) and self.stop[0] > 0 else []
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, point) > chord:
+                continue
+            if self.left[node] < 0:
+                segment = slice(self.start[node], self.stop[node])
+                leaf_distances = np.linalg.norm(self.xyz[segment] - point, axis=1)
+                inside = leaf_distances <= chord
+                found.append(self.order[segment][inside])
+                distances.append(leaf_distances[inside])
+            else:
+                stack.extend((self.left[node], self.right[node]))
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        found, distances = np.concatenate(found), np.concatenate(distances)
+        sort = np.argsort(distances, kind='stable')
+        return found[sort], self.km_from_chord(distances[sort])
+
+    def query_nearest(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Индексы k ближайших точек и расстояния до них (км), по возрастанию расстояния"""
+        point = self.to_unit(np.array([lat]), np.array([lon]))[0]
+        best_index, best_distance = np.empty(0, dtype=np.int64), np.empty(0)
+        heap = [(0.0, 0)] if len(self.start) and self.stop[0] > 0 and k > 0 else []
+        while heap:
+            bound, node = heapq.heappop(heap)
+            # Best-first: once the closest remaining box is farther than the k-th candidate, we are done
+            if len(best_distance) == k and bound > best_distance.max():
+                break
+            if self.left[node] < 0:
+                segment = slice(self.start[node], self.stop[node])
+                best_index = np.concatenate([best_index, self.order[segment]])
+                best_distance = np.concatenate([best_distance, np.linalg.norm(self.xyz[segment] - point, axis=1)])
+                if len(best_distance) > k:
+                    keep = np.argpartition(best_distance, k - 1)[:k]
+                    best_index, best_distance = best_index[keep], best_distance[keep]
+            else:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(heap, (self._box_distance(child, point), child))
+        sort = np.argsort(best_distance, kind='stable')
+        return best_index[sort], self.km_from_chord(best_distance[sort])
+
+
+class FlightProximityIndex:
+    """Точки взлета и посадки полетов с деревом на единичной сфере и описанием полетов для ответа API"""
+
+    def __init__(self, tree: SphericalKDTree, lat: np.ndarray, lon: np.ndarray, point_flight: np.ndarray,
+                 point_kind: np.ndarray, flight_ids: np.ndarray, flight_dates: np.ndarray):
+        self.tree = tree
+        self.lat, self.lon = lat, lon
+        self.point_flight, self.point_kind = point_flight, point_kind
+        self.flight_ids, self.flight_dates = flight_ids, flight_dates
+
+    @classmethod
+    def build(cls, points: 'FlightPointCollector', leaf_size: int = 64) -> 'FlightProximityIndex':
+        """Строит индекс по собранным точкам"""
+        arrays = points.arrays()
+        lat, lon = arrays["lat"], arrays["lon"]
+        return cls(SphericalKDTree.build(lat, lon, leaf_size), lat, lon, arrays["point_flight"],
+                   arrays["point_kind"], arrays["flight_ids"], arrays["flight_dates"])
+
+    def save(self, path: str) -> None:
+        """Сохраняет индекс в npz (атомарная замена файла)"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, lat=self.lat, lon=self.lon, point_flight=self.point_flight, point_kind=self.point_kind,
+                 flight_ids=self.flight_ids, flight_dates=self.flight_dates, **self.tree.arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FlightProximityIndex':
+        """Загружает индекс, построенный при импорте"""
+        with np.load(path) as data:
+            arrays = {key: data[key] for key in data.files}
+        return cls(SphericalKDTree.from_arrays(arrays), arrays['lat'], arrays['lon'], arrays['point_flight'],
+                   arrays['point_kind'], arrays['flight_ids'], arrays['flight_dates'])
+
+    def near(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Dict]:
+        """Полеты, у которых точка взлета или посадки лежит в радиусе (ближайшая точка на полет)"""
+        points, distances = self.tree.query_radius(lat, lon, radius_km)
+        return self._describe(points, distances, limit)
+
+    def nearest(self, lat: float, lon: float, count: int) -> List[Dict]:
+        """count ближайших полетов к точке"""
+        # A flight has at most two points, so the 2*count nearest points contain the count nearest flights
+        points, distances = self.tree.query_nearest(lat, lon, 2 * count)
+        return self._describe(points, distances, count)
+
+    def _describe(self, points: np.ndarray, distances: np.ndarray, limit: Optional[int]) -> List[Dict]:
+        """Оставляет ближайшую точку каждого полета (точки уже отсортированы по расстоянию)"""
+        first = np.sort(np.unique(self.point_flight[points], return_index=True)[1])[:limit]
+        result = []
+        for position in first:
+            point = points[position]
+            flight = self.point_flight[point]
+            result.append({
+                "flight_identification": str(self.flight_ids[flight]),
+                "takeoff_date": str(self.flight_dates[flight]) or None,
+                "point": POINT_KINDS[self.point_kind[point]],
+                "lat": round(float(self.lat[point]), 6),
+                "lon": round(float(self.lon[point]), 6),
+                "distance_km": round(float(distances[position]), 3),
+            })
+        return result
+
+
+class FlightPointCollector:
+    """Собирает точки взлета и посадки уникальных полетов для индекса близости (массивами по порциям)"""
+
+    def __init__(self, deduplicator: Optional[FlightDeduplicator] = None):
+        # Shared with the other accumulators; records it later supersedes are dropped in arrays()
+        self.deduplicator = deduplicator
+        self.flights = 0
+        self.slots = 0
+        self.chunks: List[Dict[str, np.ndarray]] = []
+
+    def add_points(self, flight_ids: List[str], takeoff_dates: List[Optional[str]],
+                   takeoffs: List[Optional[Tuple[float, float]]], landings: List[Optional[Tuple[float, float]]]) -> None:
+        """Добавляет порцию уникальных полетов с их точками (полеты без точек пропускаются)"""
+        ids, slots, dates, lat, lon, point_flight, point_kind = [], [], [], [], [], [], []
+        for offset, (flight_id, takeoff_date, takeoff, landing) in enumerate(
+                zip(flight_ids, takeoff_dates, takeoffs, landings)):
+            if not flight_id or not (takeoff or landing):
+                continue
+            index = self.flights + len(ids)
+            ids.append(flight_id)
+            slots.append(self.slots + offset)
+            dates.append(takeoff_date or '')
+            for kind, coords in ((TAKEOFF, takeoff), (LANDING, landing)):
+                if coords:
+                    lat.append(coords[0])
+                    lon.append(coords[1])
+                    point_flight.append(index)
+                    point_kind.append(kind)
+        self.slots += len(flight_ids)
+        if not ids:
+            return
+        self.flights += len(ids)
+        # float32 keeps coordinates to about half a metre at half the memory of Python floats in lists
+        self.chunks.append({
+            "flight_ids": np.asarray(ids, dtype=str),
+            "flight_slots": np.asarray(slots, dtype=np.int64),
+            "flight_dates": np.asarray(dates, dtype=str),
+            "lat": np.asarray(lat, dtype=np.float32),
+            "lon": np.asarray(lon, dtype=np.float32),
+            "point_flight": np.asarray(point_flight, dtype=np.int64),
+            "point_kind": np.asarray(point_kind, dtype=np.int8),
+        })
+
+    def add(self, flights: List[FlightData]) -> None:
+        """Учитывает порцию полетов, отобранных FlightDeduplicator.select"""
+        self.add_points([flight.flight_identification for flight in flights],
+                        [(flight.takeoff_date or {}).get('iso') for flight in flights],
+                        [flight.get_takeoff_coordinates() for flight in flights],
+                        [flight.get_landing_coordinates() for flight in flights])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Собранные массивы точек и полетов"""
+        if not self.chunks:
+            return {"flight_ids": np.empty(0, dtype=str), "flight_dates": np.empty(0, dtype=str),
+                    "lat": np.empty(0, dtype=np.float32), "lon": np.empty(0, dtype=np.float32),
+                    "point_flight": np.empty(0, dtype=np.int64), "point_kind": np.empty(0, dtype=np.int8)}
+        arrays = {key: np.concatenate([chunk[key] for chunk in self.chunks]) for key in self.chunks[0]}
+        slots = arrays.pop("flight_slots")
+        if self.deduplicator is None:
+            return arrays
+        # Drop superseded records with their points and renumber the remaining flights
+        keep = self.deduplicator.valid()[slots]
+        point_keep = keep[arrays["point_flight"]]
+        renumbered = np.cumsum(keep) - 1
+        for key in ("flight_ids", "flight_dates"):
+            arrays[key] = arrays[key][keep]
+        for key in ("lat", "lon", "point_kind"):
+            arrays[key] = arrays[key][point_keep]
+        arrays["point_flight"] = renumbered[arrays["point_flight"][point_keep]]
+        return arrays
@@ -1,32 +1,181 @@
 
 import json
+import os
+from contextlib import contextmanager
 import geopandas as gpd
-from typing import List, Dict, Tuple
+import numpy as np
+import shapely
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple, Union
 from dev.backend.src.entities.flight import FlightData
-from dev.backend.config import SHAPEFILE_PATH
+from dev.backend.src.analyzers.flight_deduplicator import FlightDeduplicator
+from dev.backend.src.utils.region_registry import get_region_registry
+from dev.backend.config import SHAPEFILE_PATH, LOCATE_WORKERS, LOCATE_PARALLEL_MIN_POINTS, LOCATE_CHUNK_SIZE, \
+    REGIONS_REGISTRY_PATH, REGION_METRICS_PATH, EQUAL_AREA_CRS, LOCATE_SNAP_KM
+
+KM_PER_DEGREE = 111.32
+EARTH_RADIUS_KM = 6371.0088
 
 
 class RegionAnalyzer:
     """Анализатор регионов для полетов БПЛА"""
 
     def __init__(self):
+        self.registry = get_region_registry()
         self.gdf = gpd.read_file(SHAPEFILE_PATH + ".shp")
+        # Join the shapefile to the registry once, so the pipeline works with integer codes only
+        self.gdf['code'] = self.registry.codes_for(self.gdf['name'])
+        unknown = self.gdf.loc[self.gdf['code'] == 0, 'name'].tolist()
+        if unknown:
+            print(f"Регионы шейп-файла отсутствуют в справочнике: {unknown}")
+        self.geometry_codes = self.gdf['code'].to_numpy(dtype=np.int16)
+        self.tree = shapely.STRtree(self.gdf.geometry.values)
+        self.region_area_km2 = self._region_areas()
+        # Filled by the attribution passes (statistics, store ingest), not by secondary aggregates
+        self.locate_report = self.empty_report()
+        # Set inside parallel_pass(): large locate() calls share one process pool
+        self.in_parallel_pass = False
+        self.parallel_locator = None
+
+    def _region_areas(self) -> np.ndarray:
+        """Площадь регионов в км² по кодам (равновеликая проекция); считается один раз и кэшируется в файле"""
+        source = {
+            "shapefile": list(self._file_version(SHAPEFILE_PATH + ".shp")),
+            "registry": list(self._file_version(REGIONS_REGISTRY_PATH)),
+            "crs": EQUAL_AREA_CRS,
+        }
+        areas = np.zeros(self.registry.size, dtype=np.float64)
+        try:
+            with open(REGION_METRICS_PATH, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get("source") == source:
+                for code, metrics in cached["regions"].items():
+                    areas[int(code)] = metrics["area_km2"]
+                return areas
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # The shapefile stores (lat, lon) as (x, y): swap before projecting
+        geometries = shapely.transform(self.gdf.geometry.values, lambda coords: coords[:, ::-1])
+        polygon_areas = gpd.GeoSeries(geometries, crs="EPSG:4326").to_crs(EQUAL_AREA_CRS).area.to_numpy() / 1e6
+        areas = np.bincount(self.geometry_codes, weights=polygon_areas, minlength=self.registry.size)
+        areas[0] = 0
+
+        os.makedirs(os.path.dirname(REGION_METRICS_PATH), exist_ok=True)
+        tmp_path = REGION_METRICS_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "source": source,
+                "regions": {str(code): {"area_km2": float(areas[code])} for code in np.flatnonzero(areas)},
+            }, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, REGION_METRICS_PATH)
+        print(f"Region metrics written to {REGION_METRICS_PATH}")
+        return areas
+
+    @staticmethod
+    def _file_version(path: str) -> Tuple[int, float]:
+        """Размер и время изменения файла (ключ кэша)"""
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def coordinate_arrays(coordinates: List[Tuple[float, float]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Преобразует список (lon, lat) из extract_coordinates в массивы lat и lon"""
+        if not coordinates:
+            return np.empty(0), np.empty(0)
+        coords = np.asarray(coordinates, dtype=np.float64)
+        return coords[:, 1], coords[:, 0]
+
+    @staticmethod
+    def empty_report() -> Dict[str, int]:
+        """Счетчики определения регионов: всего точек, привязанных к ближайшему региону и оставшихся вне регионов"""
+        return {"points": 0, "snapped": 0, "unmatched": 0}
+
+    def locate(self, lat: np.ndarray, lon: np.ndarray, report: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """Возвращает код региона для каждой точки (0, если точка вне всех регионов и дальше LOCATE_SNAP_KM)"""
+        if LOCATE_WORKERS > 1 and len(lat) >= LOCATE_PARALLEL_MIN_POINTS:
+            if not self.in_parallel_pass:
+                with self._new_parallel_locator() as locator:
+                    return locator.locate(lat, lon, report=report)
+            if self.parallel_locator is None:
+                self.parallel_locator = self._new_parallel_locator()
+            return self.parallel_locator.locate(lat, lon, report=report)
+        return locate_points(self.tree, self.geometry_codes, lat, lon, LOCATE_SNAP_KM, report)
+
+    def _new_parallel_locator(self):
+        """Запускает пул процессов для определения регионов"""
+        # Imported here: parallel_locator itself depends on this module
+        from dev.backend.src.analyzers.parallel_locator import ParallelRegionLocator
+        return ParallelRegionLocator(self, LOCATE_WORKERS, LOCATE_CHUNK_SIZE, snap_km=LOCATE_SNAP_KM)
+
+    @contextmanager
+    def parallel_pass(self) -> Iterator['RegionAnalyzer']:
+        """Проход (загрузка, перепривязка), в котором все большие вызовы locate используют один пул процессов"""
+        # The pool starts on the first large call only, so small passes never pay for it
+        self.in_parallel_pass = True
+        try:
+            yield self
+        finally:
+            self.in_parallel_pass = False
+            if self.parallel_locator is not None:
+                self.parallel_locator.close()
+                self.parallel_locator = None
+
+    def region_counts(self, codes: np.ndarray) -> np.ndarray:
+        """Считает число точек по кодам регионов (индекс массива равен коду)"""
+        return np.bincount(codes, minlength=self.registry.size)
 
     def flights_percent(self, coordinates: List[Tuple[float, float]]) -> Dict:
         """Вычисляет процентное распределение координат по регионам"""
-        # Placeholder: Implement actual logic based on your requirements
-        points = gpd.GeoDataFrame(
-            geometry=[gpd.points_from_xy([lon], [lat])[0] for lat, lon in coordinates],
-            crs="EPSG:4326"
-        )
-        joined = gpd.sjoin(points, self.gdf, how="left", predicate="within")
-        region_counts = joined['name'].value_counts().to_dict()
+        region_counts = self.count_regions(coordinates)
         total = len(coordinates)
         return {region: (count / total * 100) if total > 0 else 0 for region, count in region_counts.items()}
 
-    def extract_coordinates(self, flights: List[FlightData]) -> List[Tuple[float, float]]:
+    def count_regions(self, coordinates: List[Tuple[float, float]]) -> Dict[str, int]:
+        """Считает число координат, попавших в каждый регион"""
+        counts = self.region_counts(self.locate(*self.coordinate_arrays(coordinates), report=self.locate_report))
+        return {self.registry.name(code): int(counts[code]) for code in np.flatnonzero(counts[1:]) + 1}
+
+    def flight_codes(self, flights: List[FlightData], report: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """Возвращает код региона для каждого полета по точке взлета или посадки (0 - нет координат или вне регионов)"""
+        indices, points = [], []
+        for i, flight in enumerate(flights):
+            coords = flight.get_takeoff_coordinates() or flight.get_landing_coordinates()
+            if coords:
+                indices.append(i)
+                points.append(coords)
+
+        codes = np.zeros(len(flights), dtype=np.int16)
+        if points:
+            coords = np.asarray(points, dtype=np.float64)
+            codes[indices] = self.locate(coords[:, 0], coords[:, 1], report)
+        return codes
+
+    def region_codes(self, flights: List[FlightData],
+                     report: Optional[Dict[str, int]] = None) -> List[Optional[int]]:
+        """Возвращает код региона для каждого полета (по точке взлета или посадки)"""
+        return [int(code) if code else None for code in self.flight_codes(flights, report)]
+
+    def statistics_from_counts(self, region_counts: Union[np.ndarray, Dict[int, int]], total: int) -> Dict:
+        """Строит JSON в формате data.json из числа полетов по кодам регионов"""
+        if isinstance(region_counts, dict):
+            region_counts = {int(code): count for code, count in region_counts.items()}
+        else:
+            region_counts = {code: int(region_counts[code]) for code in np.flatnonzero(region_counts)}
+
+        result = {}
+        for code, count in sorted(region_counts.items(), key=lambda item: -item[1]):
+            name = self.registry.name(code)
+            if name and count:
+                result[str(code)] = {
+                    "name": name,
+                    "drone_count": (count / total * 100) if total > 0 else 0
+                }
+        return result
+
+    def extract_coordinates(self, flights: Iterable[FlightData],
+                            seen_ids: Optional[Set[str]] = None) -> List[Tuple[float, float]]:
         """Извлекает уникальные координаты взлета (или посадки, если взлета нет)"""
-        seen_ids = set()
+        seen_ids = set() if seen_ids is None else seen_ids
         coordinates_list = []
 
         for flight in flights:
@@ -54,103 +203,85 @@ class RegionAnalyzer:
     #     }
     def compute_flight_statistics(self, flights: List[FlightData]) -> Dict:
         """Вычисляет статистику полетов и возвращает JSON в формате data.json с нумерацией регионов из data.json"""
-        coordinates = self.extract_coordinates(flights)
-        region_percent = self.flights_percent(coordinates)
-        result = {}
-        region_id_map = {
-            "Республика Адыгея": "1",
-            "Республика Башкортостан": "2",
-            "Республика Бурятия": "3",
-            "Республика Алтай": "4",
-            "Республика Дагестан": "5",
-            "Республика Ингушетия": "6",
-            "Карачаево-Черкесская Республика": "7",
-            "Республика Калмыкия": "8",
-            "Кабардино-Балкарская Республика": "9",
-            "Республика Карелия": "10",
-            "Республика Коми": "11",
-            "Республика Марий Эл": "12",
-            "Республика Мордовия": "13",
-            "Республика Саха (Якутия)": "14",
-            "Республика Татарстан": "16",
-            "Республика Северная Осетия-Алания": "17",
-            "Удмуртская Республика": "18",
-            "Республика Хакасия": "19",
-            "Чеченская Республика": "20",
-            "Чувашская Республика": "21",
-            "Алтайский край": "22",
-            "Краснодарский край": "23",
-            "Красноярский край": "24",
-            "Приморский край": "25",
-            "Ставропольский край": "26",
-            "Хабаровский край": "27",
-            "Амурская область": "28",
-            "Архангельская область": "29",
-            "Астраханская область": "30",
-            "Белгородская область": "31",
-            "Брянская область": "32",
-            "Владимирская область": "33",
-            "Волгоградская область": "34",
-            "Вологодская область": "35",
-            "Воронежская область": "36",
-            "Ивановская область": "37",
-            "Иркутская область": "38",
-            "Калининградская область": "39",
-            "Калужская область": "40",
-            "Камчатский край": "41",
-            "Кемеровская область": "42",
-            "Кировская область": "43",
-            "Костромская область": "44",
-            "Курганская область": "45",
-            "Курская область": "46",
-            "Ленинградская область": "47",
-            "Липецкая область": "48",
-            "Магаданская область": "49",
-            "Московская область": "50",
-            "Мурманская область": "51",
-            "Нижегородская область": "52",
-            "Новгородская область": "53",
-            "Новосибирская область": "54",
-            "Омская область": "55",
-            "Оренбургская область": "56",
-            "Орловская область": "57",
-            "Пензенская область": "58",
-            "Пермский край": "59",
-            "Псковская область": "60",
-            "Ростовская область": "61",
-            "Рязанская область": "62",
-            "Самарская область": "63",
-            "Саратовская область": "64",
-            "Сахалинская область": "65",
-            "Свердловская область": "66",
-            "Смоленская область": "67",
-            "Тамбовская область": "68",
-            "Тверская область": "69",
-            "Томская область": "70",
-            "Тульская область": "71",
-            "Тюменская область": "72",
-            "Ульяновская область": "73",
-            "Челябинская область": "74",
-            "Забайкальский край": "75",
-            "Ярославская область": "76",
-            "г. Москва": "77",
-            "г. Санкт-Петербург": "78",
-            "Еврейская автономная область": "79",
-            "Ненецкий автономный округ": "83",
-            "Ханты-Мансийский автономный округ": "86",
-            "Чукотский АО": "87",
-            "Ямало-Ненецкий автономный округ": "89",
-            "Республика Крым": "90",
-            "Донецкая Народная Республика": "91",
-            "Луганская Народная Республика": "92",
-            "Севастополь": "93"
-        }
-        for region_name, percent in region_percent.items():
-            region_id = region_id_map.get(region_name)
-            if region_id:
-                result[region_id] = {
-                    "name": region_name,
-                    "drone_count": percent
-                }
-        return result
+        return self.statistics_from_codes(self.flight_codes(FlightDeduplicator.unique(flights), self.locate_report))
+
+    def statistics_from_codes(self, codes: np.ndarray) -> Dict:
+        """Статистика по кодам регионов уникальных полетов с координатами (по одному коду на полет)"""
+        return self.statistics_from_counts(self.region_counts(codes), len(codes))
+
+
+class RegionStatsAccumulator:
+    """Накапливает коды регионов отобранных записей полетов (для потоковой обработки)"""
+
+    def __init__(self, analyzer: RegionAnalyzer, deduplicator: FlightDeduplicator):
+        self.analyzer = analyzer
+        # Shared with the other accumulators; records it later supersedes are dropped in result()
+        self.deduplicator = deduplicator
+        self.codes: List[np.ndarray] = []
+
+    def add(self, codes: np.ndarray) -> None:
+        """Учитывает коды регионов очередной порции, отобранной deduplicator.select"""
+        self.codes.append(np.asarray(codes, dtype=np.int16))
+
+    def result(self) -> Dict:
+        """Возвращает статистику в том же формате, что и compute_flight_statistics"""
+        codes = np.concatenate(self.codes) if self.codes else np.empty(0, dtype=np.int16)
+        return self.analyzer.statistics_from_codes(codes[self.deduplicator.valid()[:len(codes)]])
+
+
+def locate_points(tree: shapely.STRtree, geometry_codes: np.ndarray, lat: np.ndarray, lon: np.ndarray,
+                  snap_km: float = 0.0, report: Optional[Dict[str, int]] = None) -> np.ndarray:
+    """Определяет код региона для массива точек через пространственный индекс"""
+    codes = np.zeros(len(lat), dtype=np.int16)
+    if len(lat) == 0:
+        return codes
+    # The shapefile stores (lat, lon) as (x, y)
+    points = shapely.points(lat, lon)
+    point_index, geometry_index = tree.query(points, predicate="within")
+    if len(point_index):
+        # A point on a shared border matches several regions: keep the lowest geometry index
+        order = np.lexsort((geometry_index, point_index))
+        point_index, geometry_index = point_index[order], geometry_index[order]
+        first = np.unique(point_index, return_index=True)[1]
+        codes[point_index[first]] = geometry_codes[geometry_index[first]]
+
+    snapped = snap_to_nearest(tree, geometry_codes, points, codes, snap_km) if snap_km > 0 else 0
+    if report is not None:
+        report["points"] += len(codes)
+        report["snapped"] += snapped
+        report["unmatched"] += int(np.count_nonzero(codes == 0))
+    return codes
+
+
+def snap_to_nearest(tree: shapely.STRtree, geometry_codes: np.ndarray, points: np.ndarray,
+                    codes: np.ndarray, snap_km: float) -> int:
+    """Присваивает точкам вне регионов ближайший регион не дальше snap_km; возвращает число таких точек"""
+    outside = np.flatnonzero(codes == 0)
+    if len(outside) == 0:
+        return 0
+    # Index search works in degrees: bound it by the widest degree of longitude among these points
+    max_lat = min(float(np.abs(shapely.get_x(points[outside])).max()), 85.0)
+    max_degrees = snap_km / (KM_PER_DEGREE * np.cos(np.radians(max_lat)))
+    # Every region within the bound is a candidate: the nearest one in degrees is not the nearest
+    # on the sphere, since a degree of longitude shrinks towards the poles
+    point_index, geometry_index = tree.query(points[outside], predicate="dwithin", distance=max_degrees)
+    if len(point_index) == 0:
+        return 0
+
+    # Exact distance on the sphere between the point and the closest point of each candidate region
+    lines = shapely.shortest_line(points[outside[point_index]], tree.geometries[geometry_index])
+    ends = shapely.get_coordinates(lines).reshape(-1, 2, 2)
+    distance = haversine_km(ends[:, 0, 0], ends[:, 0, 1], ends[:, 1, 0], ends[:, 1, 1])
+    # Closest candidate per point; equal distances go to the lowest geometry index, as in locate_points
+    order = np.lexsort((geometry_index, distance, point_index))
+    first = order[np.unique(point_index[order], return_index=True)[1]]
+    close = first[distance[first] <= snap_km]
+    codes[outside[point_index[close]]] = geometry_codes[geometry_index[close]]
+    return len(close)
+
 
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Расстояние по большому кругу в километрах"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
@@ -0,0 +1,109 @@
+
+from typing import Dict, List, Optional, Set, Union
+import numpy as np
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.entities.flight import FlightData
+
+
+class RegionShareEstimator:
+    """Оценивает доли регионов по случайной выборке строк с доверительными интервалами"""
+
+    def __init__(self, analyzer: RegionAnalyzer, z: float = 1.96,
+                 baseline_counts: Optional[Union[np.ndarray, Dict[int, int]]] = None, baseline_total: int = 0):
+        self.analyzer = analyzer
+        self.z = z
+        self.seen_ids: Set[str] = set()
+        size = analyzer.registry.size
+        # Rows are the sampling unit and one row may hold several flights, so the variance is taken over rows:
+        # per region sums of y (flights of the region in a row), y^2 and x*y, where x is all flights of the row
+        self.rows = 0
+        self.sampled = 0
+        self.sum_x2 = 0.0
+        self.region_counts = np.zeros(size, dtype=np.float64)
+        self.sum_y2 = np.zeros(size, dtype=np.float64)
+        self.sum_xy = np.zeros(size, dtype=np.float64)
+        # Exact counts of data that is not being sampled (flights already in the store)
+        self.baseline_counts = np.zeros(size, dtype=np.float64)
+        if isinstance(baseline_counts, dict):
+            for code, count in baseline_counts.items():
+                if 0 < int(code) < size:
+                    self.baseline_counts[int(code)] = count
+        elif baseline_counts is not None:
+            self.baseline_counts[:len(baseline_counts)] = baseline_counts
+        self.baseline_total = baseline_total
+
+    def add(self, rows: List[List[FlightData]]) -> None:
+        """Учитывает очередную порцию строк выборки (повторы идентификатора, как и в статистике, не считаются)"""
+        row_index, coordinates = [], []
+        for i, flights in enumerate(rows):
+            row_coordinates = self.analyzer.extract_coordinates(flights, self.seen_ids)
+            coordinates.extend(row_coordinates)
+            row_index.extend([i] * len(row_coordinates))
+        self.rows += len(rows)
+        if not row_index:
+            return
+
+        row_index = np.asarray(row_index, dtype=np.int64)
+        x = np.bincount(row_index, minlength=len(rows)).astype(np.float64)
+        size = self.analyzer.registry.size
+        codes = self.analyzer.locate(*self.analyzer.coordinate_arrays(coordinates))
+        pairs, y = np.unique(row_index * size + codes, return_counts=True)
+        pair_row, pair_code = pairs // size, pairs % size
+        self.region_counts += np.bincount(pair_code, weights=y, minlength=size)
+        self.sum_y2 += np.bincount(pair_code, weights=y.astype(np.float64) ** 2, minlength=size)
+        self.sum_xy += np.bincount(pair_code, weights=y * x[pair_row], minlength=size)
+        self.sampled += int(x.sum())
+        self.sum_x2 += float(x @ x)
+
+    def intervals(self, inclusion: float) -> Dict[str, np.ndarray]:
+        """Доли регионов среди выбранных полетов и интервалы Уилсона с эффективным объемом выборки строк"""
+        n = max(self.sampled, 1)
+        share = self.region_counts / n
+        # Rows enter the sample independently with probability `inclusion`; at 1 the sample is the whole file
+        correction = max(1.0 - inclusion, 0.0)
+        if correction == 0 or self.sampled == 0 or self.rows < 2:
+            return {"share": share, "low": share, "high": share}
+        # Ratio estimator variance over rows, turned into an effective sample size for the Wilson interval
+        residual = np.maximum(self.sum_y2 - 2 * share * self.sum_xy + share ** 2 * self.sum_x2, 0)
+        mean_x = self.sampled / self.rows
+        variance = correction * residual / (self.rows - 1) / (self.rows * mean_x ** 2)
+        binomial = share * (1 - share)
+        n_eff = np.where(variance > 0, binomial / np.where(variance > 0, variance, 1), n / correction)
+        n_eff = np.where(binomial > 0, n_eff, n / correction)
+        z2 = self.z ** 2
+        center = (share + z2 / (2 * n_eff)) / (1 + z2 / n_eff)
+        half = self.z / (1 + z2 / n_eff) * np.sqrt(binomial / n_eff + z2 / (4 * n_eff ** 2))
+        return {"share": share, "low": np.clip(center - half, 0, 1), "high": np.clip(center + half, 0, 1)}
+
+    def statistics(self, inclusion: float) -> Dict:
+        """Приближенная статистика в формате compute_flight_statistics с полями ci_low, ci_high и approximate"""
+        bounds = self.intervals(inclusion)
+        # The sampled part is scaled up to its estimated size and added to the exact baseline
+        population = self.sampled / inclusion if inclusion > 0 else 0
+        total = self.baseline_total + population
+        if total <= 0:
+            return {}
+
+        def percent(values: np.ndarray) -> np.ndarray:
+            return (self.baseline_counts + values * population) / total * 100
+
+        estimate, low, high = percent(bounds["share"]), percent(bounds["low"]), percent(bounds["high"])
+        result = {}
+        for code in sorted(np.flatnonzero(estimate), key=lambda code: -estimate[code]):
+            name = self.analyzer.registry.name(int(code))
+            if name:
+                result[str(code)] = {
+                    "name": name,
+                    "drone_count": float(estimate[code]),
+                    "ci_low": float(low[code]),
+                    "ci_high": float(high[code]),
+                    "approximate": True,
+                }
+        return result
+
+    def max_half_width(self, inclusion: float) -> float:
+        """Наибольшая полуширина интервала среди регионов (в процентных пунктах доли выборки)"""
+        if self.sampled == 0:
+            return 100.0
+        bounds = self.intervals(inclusion)
+        return float(np.max(bounds["high"] - bounds["low"]) / 2 * 100)
@@ -1,6 +1,8 @@
 
+from datetime import datetime, timedelta
 from typing import Optional, Tuple
 from dev.backend.src.entities.coordinates import Coordinates
+from dev.backend.config import MAX_FLIGHT_HOURS
 
 
 class FlightData:
@@ -16,6 +18,8 @@ class FlightData:
         self.takeoff_date: Optional[dict] = None
         self.landing_date: Optional[dict] = None
         self.source_sheet: Optional[str] = None
+        # SHR/DEP/ARR for raw messages; used only while correlating, not exported
+        self.message_type: Optional[str] = None
 
     def to_dict(self) -> dict:
         """Преобразует объект в словарь для JSON"""
@@ -31,6 +35,23 @@ class FlightData:
             "source_sheet": self.source_sheet
         }
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'FlightData':
+        """Восстанавливает объект из словаря to_dict"""
+        flight = cls()
+        for field, value in data.items():
+            if field in ('takeoff_coordinates', 'landing_coordinates') and value is not None:
+                value = tuple(value)
+            setattr(flight, field, value)
+        return flight
+
+    def completeness(self) -> int:
+        """Число заполненных полей записи: из повторов одного полета остается самая полная"""
+        # FlightStore.BEST_FLIGHT_IDS counts the same fields on stored rows
+        return sum(1 for value in (self.takeoff_coordinates, self.landing_coordinates, self.takeoff_time,
+                                   self.landing_time, (self.takeoff_date or {}).get('iso'),
+                                   (self.landing_date or {}).get('iso'), self.uav_type) if value)
+
     def get_takeoff_coordinates(self) -> Optional[Tuple[float, float]]:
         """Возвращает координаты взлета"""
         return self.takeoff_coordinates
@@ -39,3 +60,31 @@ class FlightData:
         """Возвращает координаты посадки"""
         return self.landing_coordinates
 
+    def get_flight_interval(self) -> Optional[Tuple[datetime, datetime]]:
+        """Возвращает время взлета и посадки (None, если время взлета или посадки неизвестно)"""
+        return self.interval_from((self.takeoff_date or {}).get('iso'), self.takeoff_time,
+                                  (self.landing_date or {}).get('iso'), self.landing_time)
+
+    def get_duration_hours(self) -> Optional[float]:
+        """Возвращает длительность полета в часах (None, если время взлета или посадки неизвестно)"""
+        interval = self.get_flight_interval()
+        if interval is None:
+            return None
+        return (interval[1] - interval[0]).total_seconds() / 3600
+
+    @staticmethod
+    def interval_from(takeoff_date: Optional[str], takeoff_time: Optional[str],
+                      landing_date: Optional[str], landing_time: Optional[str]) -> Optional[Tuple[datetime, datetime]]:
+        """Собирает интервал полета из ISO-дат и времени ЧЧММ (также для строк хранилища)"""
+        if not takeoff_date or not takeoff_time or not landing_time:
+            return None
+        try:
+            start = datetime.strptime(f"{takeoff_date} {takeoff_time}", "%Y-%m-%d %H%M")
+            end = datetime.strptime(f"{landing_date or takeoff_date} {landing_time}", "%Y-%m-%d %H%M")
+        except ValueError:
+            return None
+        if end < start and not landing_date:
+            # Landing after midnight without its own date
+            end += timedelta(days=1)
+        hours = (end - start).total_seconds() / 3600
+        return (start, end) if 0 <= hours <= MAX_FLIGHT_HOURS else None
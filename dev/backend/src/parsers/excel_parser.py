@@ -1,10 +1,14 @@
 
+import os
+import numpy as np
 import pandas as pd
-from typing import List, Dict
-from dev.backend.config import REQUIRED_FIELDS
+from typing import List, Dict, Iterable, Iterator, Optional
+from dev.backend.config import REQUIRED_FIELDS, CORRELATION_WINDOW_DAYS, CORRELATION_MAX_PENDING, \
+    CORRELATION_WATERMARK_SAMPLES
 from dev.backend.src.utils.data_mapper import DataMapper
 from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
 from dev.backend.src.entities.flight import FlightData
+from dev.backend.src.services.message_correlator import MessageCorrelator
 
 
 class ExcelParser:
@@ -16,32 +20,61 @@ class ExcelParser:
 
     def parse_excel(self, file_path: str, uav_parser: UAVFlightParser) -> List[FlightData]:
         """Парсит Excel-файл, возвращая список объектов FlightData"""
-        all_flights = []
-
+        return list(self.iter_excel(file_path, uav_parser))
+
+    def iter_files(self, file_paths: Iterable[str], uav_parser: UAVFlightParser) -> Iterator[FlightData]:
+        """Последовательно отдает полеты из всех файлов; сообщения одного полета объединяются и между файлами"""
+        correlator = self.new_correlator()
+        for file_path in file_paths:
+            print(f"Processing file: {file_path}")
+            yield from self.iter_excel(file_path, uav_parser, correlator)
+        yield from self.drain_correlator(correlator)
+
+    def new_correlator(self) -> MessageCorrelator:
+        """Создает объединитель сообщений SHR/DEP/ARR с настройками из конфигурации"""
+        return MessageCorrelator(CORRELATION_WINDOW_DAYS, CORRELATION_MAX_PENDING, CORRELATION_WATERMARK_SAMPLES)
+
+    def iter_excel(self, file_path: str, uav_parser: UAVFlightParser,
+                   correlator: Optional[MessageCorrelator] = None) -> Iterator[FlightData]:
+        """Парсит Excel-файл построчно, отдавая объекты FlightData по мере разбора"""
+        # An external correlator keeps partial flights for the next files; the caller drains it
+        own_correlator = correlator is None
+        if own_correlator:
+            correlator = self.new_correlator()
+        correlator.source = os.path.abspath(file_path)
         try:
-            xl = pd.ExcelFile(file_path)
-            for sheet_name in xl.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                if df.empty:
-                    continue
+            with pd.ExcelFile(file_path) as xl:
+                for sheet_name in xl.sheet_names:
+                    df = xl.parse(sheet_name)
+                    if df.empty:
+                        continue
 
-                print(f"Processing sheet {sheet_name}")
-                flights = self._process_sheet(df, sheet_name, uav_parser)
-                all_flights.extend(flights)
+                    print(f"Processing sheet {sheet_name}")
+                    yield from self._process_sheet(df, sheet_name, uav_parser, correlator)
+                    # Only one sheet is held in memory at a time
+                    del df
 
         except Exception as e:
             print(f"Ошибка при обработке файла {file_path}: {e}")
 
-        return all_flights
+        if own_correlator:
+            yield from self.drain_correlator(correlator)
+
+    def drain_correlator(self, correlator: MessageCorrelator) -> Iterator[FlightData]:
+        """Отдает оставшиеся в объединителе полеты (в конце потока)"""
+        for flight in correlator.flush():
+            if self._validate_row(flight):
+                yield flight
 
-    def _process_sheet(self, df: pd.DataFrame, sheet_name: str, uav_parser: UAVFlightParser) -> List[FlightData]:
+    def _process_sheet(self, df: pd.DataFrame, sheet_name: str, uav_parser: UAVFlightParser,
+                       correlator: MessageCorrelator) -> Iterator[FlightData]:
         """Обрабатывает лист Excel"""
         df = self._normalize_dataframe(df)
         column_mapping = self.mapper.identify_columns(df.columns)
 
         # Scenario 1: Raw messages (~3 columns, likely SHR/DEP/ARR)
         if len(column_mapping) <= 4:  # Allow some extra columns for safety
-            return self._parse_raw_messages(df, sheet_name, uav_parser)
+            return self._parse_raw_messages(df, sheet_name, uav_parser, correlator)
 
         # Scenario 2: Partially parsed data
         return self._parse_structured_data(df, sheet_name, column_mapping)
@@ -60,66 +93,96 @@ class ExcelParser:
         df = df.loc[:, ~df.isnull().all()]
         return df
 
-    def _parse_raw_messages(self, df: pd.DataFrame, sheet_name: str, uav_parser: UAVFlightParser) -> List[FlightData]:
-        """Парсит сырые сообщения SHR/DEP/ARR"""
-        results = []
+    def _parse_raw_messages(self, df: pd.DataFrame, sheet_name: str, uav_parser: UAVFlightParser,
+                            correlator: MessageCorrelator) -> Iterator[FlightData]:
+        """Парсит сырые сообщения SHR/DEP/ARR, объединяя сообщения одного полета из разных строк и листов"""
         for _, row in df.iterrows():
-            messages = [str(cell) for cell in row if pd.notna(cell) and str(cell).strip()]
-            if not messages:
-                continue
-
-            # Parse messages into FlightData objects
-            flight_data_list = uav_parser.parse_multiple_messages(messages)
-            if not flight_data_list:
-                continue
-
-            # Merge into a single FlightData object
-            merged_flight = flight_data_list[0]  # Start with first (e.g., SHR)
-            for flight in flight_data_list[1:]:
-                if flight.flight_identification and not merged_flight.flight_identification:
-                    merged_flight.flight_identification = flight.flight_identification
-                if flight.uav_type and not merged_flight.uav_type:
-                    merged_flight.uav_type = flight.uav_type
-                if flight.takeoff_coordinates and not merged_flight.takeoff_coordinates:
-                    merged_flight.takeoff_coordinates = flight.takeoff_coordinates
-                if flight.landing_coordinates and not merged_flight.landing_coordinates:
-                    merged_flight.landing_coordinates = flight.landing_coordinates
-                if flight.takeoff_time and not merged_flight.takeoff_time:
-                    merged_flight.takeoff_time = flight.takeoff_time
-                if flight.landing_time and not merged_flight.landing_time:
-                    merged_flight.landing_time = flight.landing_time
-                if flight.takeoff_date and not merged_flight.takeoff_date:
-                    merged_flight.takeoff_date = flight.takeoff_date
-                if flight.landing_date and not merged_flight.landing_date:
-                    merged_flight.landing_date = flight.landing_date
-
-            if self._validate_row(merged_flight):
-                merged_flight.source_sheet = sheet_name
-                results.append(merged_flight)
-
-        return results
-
-    def _parse_structured_data(self, df: pd.DataFrame, sheet_name: str, column_mapping: Dict) -> List[FlightData]:
+            for merged_flight in correlator.add_row(self._raw_row_flights(row, sheet_name, uav_parser)):
+                if self._validate_row(merged_flight):
+                    yield merged_flight
+
+    def _raw_row_flights(self, row: pd.Series, sheet_name: str, uav_parser: UAVFlightParser) -> List[FlightData]:
+        """Разбирает сообщения одной строки сырого листа"""
+        messages = [str(cell) for cell in row if pd.notna(cell) and str(cell).strip()]
+        if not messages:
+            return []
+
+        # Parse messages into FlightData objects
+        flight_data_list = uav_parser.parse_multiple_messages(messages)
+        for flight in flight_data_list:
+            flight.source_sheet = sheet_name
+        return flight_data_list
+
+    def _parse_structured_data(self, df: pd.DataFrame, sheet_name: str, column_mapping: Dict) -> Iterator[FlightData]:
         """Парсит частично структурированные данные"""
-        results = []
         for _, row in df.iterrows():
-            flight = FlightData()
-            for field in ['flight_identification', 'uav_type', 'takeoff_coordinates',
-                          'landing_coordinates', 'takeoff_time', 'landing_time',
-                          'takeoff_date', 'landing_date']:
-                if field in column_mapping:
-                    value = row[column_mapping[field]]
-                    parsed_value = self.mapper.parse_field_value(field, value)
-                    if parsed_value:
-                        setattr(flight, field, parsed_value)
+            flight = self._structured_row_flight(row, sheet_name, column_mapping)
+            if flight is not None:
+                yield flight
+
+    def _structured_row_flight(self, row: pd.Series, sheet_name: str, column_mapping: Dict) -> Optional[FlightData]:
+        """Разбирает одну строку структурированного листа"""
+        flight = FlightData()
+        for field in ['flight_identification', 'uav_type', 'takeoff_coordinates',
+                      'landing_coordinates', 'takeoff_time', 'landing_time',
+                      'takeoff_date', 'landing_date']:
+            if field in column_mapping:
+                value = row[column_mapping[field]]
+                parsed_value = self.mapper.parse_field_value(field, value)
+                if parsed_value:
+                    setattr(flight, field, parsed_value)
+
+        if self._validate_row(flight):
+            flight.source_sheet = sheet_name
+            return flight
+        return None
+
+    def sample_excel(self, file_path: str, fraction: float, rng: np.random.Generator) -> Iterator['SheetSample']:
+        """Читает листы по одному и оставляет случайную долю строк; у каждой строки свой равномерный ключ выборки"""
+        try:
+            with pd.ExcelFile(file_path) as xl:
+                for sheet_name in xl.sheet_names:
+                    df = xl.parse(sheet_name)
+                    if df.empty:
+                        continue
+                    df = self._normalize_dataframe(df)
+                    column_mapping = self.mapper.identify_columns(df.columns)
+                    keys = rng.random(len(df))
+                    # Only rows that can enter the largest preview sample are kept in memory
+                    kept = np.flatnonzero(keys < fraction)
+                    sample = SheetSample(sheet_name, df.iloc[kept], keys[kept], len(df),
+                                         None if len(column_mapping) <= 4 else column_mapping)
+                    del df
+                    yield sample
+        except Exception as e:
+            print(f"Ошибка при обработке файла {file_path}: {e}")
 
-            if self._validate_row(flight):
-                flight.source_sheet = sheet_name
-                results.append(flight)
+    def parse_sample_row(self, sample: 'SheetSample', position: int, uav_parser: UAVFlightParser) -> List[FlightData]:
+        """Разбирает строку выборки независимо от соседних (без объединения SHR/DEP/ARR между строками)"""
+        row = sample.rows.iloc[position]
+        if sample.column_mapping is None:
+            flights = MessageCorrelator.merge_row(self._raw_row_flights(row, sample.sheet_name, uav_parser))
+            return [flight for flight, _ in flights if self._validate_row(flight)]
+        flight = self._structured_row_flight(row, sample.sheet_name, sample.column_mapping)
+        return [flight] if flight is not None else []
 
-        return results
+    def is_valid(self, flight: FlightData) -> bool:
+        """Проверяет, можно ли выдать полет (есть хотя бы одно обязательное поле)"""
+        return self._validate_row(flight)
 
     def _validate_row(self, flight: FlightData) -> bool:
         """Проверяет наличие обязательных полей"""
         return any(getattr(flight, field) is not None for field in self.required_fields)
 
+
+class SheetSample:
+    """Случайная часть строк листа с ключами выборки; column_mapping равен None для сырых сообщений"""
+
+    def __init__(self, sheet_name: str, rows: pd.DataFrame, keys: np.ndarray, total_rows: int,
+                 column_mapping: Optional[Dict]):
+        self.sheet_name = sheet_name
+        self.rows = rows
+        self.keys = keys
+        self.total_rows = total_rows
+        self.column_mapping = column_mapping
+
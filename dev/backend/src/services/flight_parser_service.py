@@ -8,9 +8,14 @@ import re
 class FlightParserService:
     """Сервис для парсинга сообщений о полетах"""
 
+    MESSAGE_TYPE_PATTERN = re.compile(r'^\s*\(?\s*(SHR|DEP|ARR)\b|-TITLE\s+I?(SHR|DEP|ARR)\b', re.IGNORECASE)
+    DOF_PATTERN = re.compile(r'\bDOF/(\d{6})')
+
     def __init__(self, code_dictionaries: Dict[str, Any]):
         self.code_dictionaries = code_dictionaries
-        self.mapper = DataMapper()
+        self.uav_codes = list(code_dictionaries['uav_type'])
+        self.coordinate_prefixes = list(code_dictionaries['coordinate_prefix'])
+        self.mapper = DataMapper(self.uav_codes + self.coordinate_prefixes)
 
     def parse_single_message(self, message: str) -> FlightData:
         """Парсит одно сообщение"""
@@ -18,25 +23,27 @@ class FlightParserService:
         if not message or not isinstance(message, str):
             return flight
 
-        # Extract fields using DataMapper
-        for field, keywords in self.mapper.column_mappings.items():
-            for keyword in keywords:
-                if keyword.lower() in message.lower():
-                    value = self._extract_value(message, keyword)
-                    parsed_value = self.mapper.parse_field_value(field, value)
-                    if parsed_value:
-                        setattr(flight, field, parsed_value)
-                    break
-
-        # Handle UAV type from code dictionary
-        for code, description in self.code_dictionaries['uav_type'].items():
-            if code in message:
-                flight.uav_type = description
+        message_type = self.MESSAGE_TYPE_PATTERN.search(message)
+        if message_type:
+            flight.message_type = (message_type.group(1) or message_type.group(2)).upper()
+
+        # A single scan finds every keyword; each field then takes its first keyword present in the message
+        found = self.mapper.find_keywords(message)
+        for field, keyword in self.mapper.first_keywords(found).items():
+            value = self._extract_value(message, keyword)
+            parsed_value = self.mapper.parse_field_value(field, value)
+            if parsed_value:
+                setattr(flight, field, parsed_value)
+
+        # Handle UAV type from code dictionary (case-sensitive: confirm the lowercased candidate)
+        for code in self.uav_codes:
+            if code.lower() in found and code in message:
+                flight.uav_type = self.code_dictionaries['uav_type'][code]
                 break
 
         # Handle coordinate prefixes
-        for prefix in self.code_dictionaries['coordinate_prefix']:
-            if prefix in message:
+        for prefix in self.coordinate_prefixes:
+            if prefix.lower() in found and prefix in message:
                 coords = self.mapper._extract_coordinates(message)
                 if coords:
                     if prefix in ['DEP', 'ADEPZ']:
@@ -45,6 +52,12 @@ class FlightParserService:
                         flight.landing_coordinates = coords
                 break
 
+        # SHR carries the flight date only as DOF/
+        if flight.takeoff_date is None:
+            dof = self.DOF_PATTERN.search(message)
+            if dof:
+                flight.takeoff_date = self.mapper.parse_field_value('takeoff_date', dof.group(1))
+
         return flight
 
     def parse_multiple_messages(self, messages: List[str]) -> List[FlightData]:
@@ -0,0 +1,87 @@
+
+import json
+import os
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+from dev.backend.config import DENSITY_PATH, DENSITY_RESOLUTIONS, REGION_RATING_PATH, FLIGHT_INTERVALS_PATH, \
+    FLIGHT_TREE_PATH, FLIGHT_TREE_LEAF_SIZE
+from dev.backend.src.analyzers.activity_analyzer import RegionActivityAccumulator
+from dev.backend.src.analyzers.concurrency_analyzer import ConcurrencyAnalyzer
+from dev.backend.src.analyzers.density_analyzer import DensityAnalyzer
+from dev.backend.src.analyzers.flight_deduplicator import FlightDeduplicator
+from dev.backend.src.analyzers.proximity_index import FlightPointCollector, FlightProximityIndex
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer, RegionStatsAccumulator
+from dev.backend.src.entities.flight import FlightData
+from dev.backend.src.parsers.excel_parser import ExcelParser
+from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
+from dev.backend.src.services.ingest_service import publish_locate_report
+from dev.backend.src.services.publish_service import publish_json, write_compressed_sidecars
+from dev.backend.src.services.stats_feed import publish_stats
+
+
+class StreamingFlightPipeline:
+    """Потоковый конвейер: разбор -> определение региона -> агрегация -> запись, порциями ограниченного размера"""
+
+    def __init__(self, excel_parser: ExcelParser, uav_parser: UAVFlightParser,
+                 analyzer: RegionAnalyzer, chunk_size: int = 5000):
+        self.excel_parser = excel_parser
+        self.uav_parser = uav_parser
+        self.analyzer = analyzer
+        self.chunk_size = chunk_size
+
+    def iter_flights(self, file_paths: Iterable[str]) -> Iterator[FlightData]:
+        """Последовательно отдает полеты из всех файлов; сообщения одного полета объединяются и между файлами"""
+        return self.excel_parser.iter_files(file_paths, self.uav_parser)
+
+    def iter_chunks(self, flights: Iterable[FlightData]) -> Iterator[List[FlightData]]:
+        """Группирует поток полетов в порции по chunk_size"""
+        iterator = iter(flights)
+        while True:
+            chunk = list(islice(iterator, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def run(self, file_paths: Iterable[str], ndjson_path: str, stats_path: str) -> Dict:
+        """Обрабатывает файлы, записывая полеты в NDJSON по мере разбора; возвращает статистику по регионам"""
+        deduplicator = FlightDeduplicator()
+        stats = RegionStatsAccumulator(self.analyzer, deduplicator)
+        density = DensityAnalyzer(DENSITY_RESOLUTIONS)
+        activity = RegionActivityAccumulator(self.analyzer, deduplicator)
+        points = FlightPointCollector(deduplicator)
+        flights_written = 0
+
+        os.makedirs(os.path.dirname(ndjson_path), exist_ok=True)
+        tmp_path = ndjson_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for chunk in self.iter_chunks(self.iter_flights(file_paths)):
+                # Regions are located once per chunk and shared by every per-region aggregate
+                selected = deduplicator.select(chunk)
+                codes = self.analyzer.flight_codes(selected, self.analyzer.locate_report)
+                stats.add(codes)
+                density.update(*DensityAnalyzer.takeoff_points(chunk))
+                activity.add(selected, codes)
+                points.add(selected)
+                f.writelines(json.dumps(flight.to_dict(), ensure_ascii=False) + "\n" for flight in chunk)
+                flights_written += len(chunk)
+                # UAVFlightParser keeps every parsed message otherwise
+                self.uav_parser.clear_data()
+        os.replace(tmp_path, ndjson_path)
+        write_compressed_sidecars(ndjson_path)
+        print(f"{flights_written} flights written to {ndjson_path}")
+
+        result = stats.result()
+        publish_stats(stats_path, result)
+        print(f"Statistics written to {stats_path}")
+
+        density.save(DENSITY_PATH)
+        print(f"Density aggregates written to {DENSITY_PATH}")
+
+        publish_json(REGION_RATING_PATH, activity.rating())
+        print(f"Region rating written to {REGION_RATING_PATH}")
+        ConcurrencyAnalyzer.save(FLIGHT_INTERVALS_PATH, *activity.intervals())
+        print(f"Flight intervals written to {FLIGHT_INTERVALS_PATH}")
+        FlightProximityIndex.build(points, FLIGHT_TREE_LEAF_SIZE).save(FLIGHT_TREE_PATH)
+        print(f"Proximity index written to {FLIGHT_TREE_PATH}")
+        publish_locate_report(self.analyzer)
+        return result
@@ -0,0 +1,160 @@
+
+import json
+import os
+from typing import Dict, Iterable, List
+import numpy as np
+from dev.backend.config import DENSITY_PATH, DENSITY_RESOLUTIONS, REGION_RATING_PATH, FLIGHT_INTERVALS_PATH, \
+    FLIGHT_TREE_PATH, FLIGHT_TREE_LEAF_SIZE, LOCATE_REPORT_PATH, LOCATE_SNAP_KM
+from dev.backend.src.analyzers.activity_analyzer import RegionActivityAccumulator, activity_arrays, \
+    activity_rating
+from dev.backend.src.analyzers.concurrency_analyzer import ConcurrencyAnalyzer
+from dev.backend.src.analyzers.density_analyzer import DensityAnalyzer
+from dev.backend.src.analyzers.proximity_index import FlightPointCollector, FlightProximityIndex
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.entities.flight import FlightData
+from dev.backend.src.parsers.excel_parser import ExcelParser
+from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
+from dev.backend.src.services.publish_service import publish_json
+from dev.backend.src.storage.flight_store import FlightStore
+
+
+def ingest_files_to_store(file_paths: Iterable[str], store: FlightStore, excel_parser: ExcelParser,
+                          uav_parser: UAVFlightParser, analyzer: RegionAnalyzer) -> Dict:
+    """Загружает в хранилище только новые или измененные файлы и пересчитывает статистику по регионам"""
+    store.save_regions(analyzer.registry.names)
+    # One correlator across files and ingests: partial flights of earlier ingests wait for their other messages
+    correlator = excel_parser.new_correlator()
+    pending = store.pending_flights()
+    for _, flight_key, date_key, day, message_types, flight, source in pending:
+        correlator.restore(flight_key, date_key, day, message_types, flight, source)
+    ingested = False
+    # Large files are located by one process pool for the whole ingest
+    with analyzer.parallel_pass():
+        for file_path in file_paths:
+            if store.is_ingested(file_path):
+                print(f"Skipping already ingested file: {file_path}")
+                continue
+            print(f"Ingesting file: {file_path}")
+            # A changed file is read again from scratch, including the flights it started
+            correlator.discard_source(os.path.abspath(file_path))
+            flights = list(excel_parser.iter_excel(file_path, uav_parser, correlator))
+            store.ingest_file(file_path, flights, analyzer.region_codes(flights, analyzer.locate_report))
+            ingested = True
+        if ingested:
+            partials = correlator.partials()
+            flights = [partial[4] for partial in partials]
+            store.save_pending([row[0] for row in pending], partials,
+                               analyzer.region_codes(flights, analyzer.locate_report),
+                               [excel_parser.is_valid(flight) for flight in flights])
+            print(f"{len(partials)} partial flights kept for the next ingest")
+
+    region_counts, total = store.region_counts()
+    stats = analyzer.statistics_from_counts(region_counts, total)
+    store.save_region_stats(stats)
+    publish_store_rating(store, analyzer)
+    publish_store_intervals(store)
+    publish_store_proximity(store)
+    publish_locate_report(analyzer)
+
+    points = np.asarray(store.takeoff_points(), dtype=np.float64).reshape(-1, 2)
+    publish_density(points[:, 0], points[:, 1])
+    return stats
+
+
+def reattribute_store(store: FlightStore, analyzer: RegionAnalyzer) -> Dict:
+    """Заново определяет регионы всех полетов хранилища (например, после обновления границ)"""
+    rows = np.asarray(store.location_points(), dtype=np.float64).reshape(-1, 3)
+    with analyzer.parallel_pass():
+        codes = analyzer.locate(rows[:, 1], rows[:, 2], analyzer.locate_report)
+    store.update_region_codes(rows[:, 0].astype(np.int64).tolist(),
+                              [int(code) if code else None for code in codes])
+    print(f"Regions re-attributed for {len(rows)} flights")
+
+    region_counts, total = store.region_counts()
+    stats = analyzer.statistics_from_counts(region_counts, total)
+    store.save_region_stats(stats)
+    publish_store_rating(store, analyzer)
+    publish_store_intervals(store)
+    publish_locate_report(analyzer)
+    return stats
+
+
+def publish_density(lat: np.ndarray, lon: np.ndarray) -> None:
+    """Пересчитывает и сохраняет плотность точек взлета для /flights/density"""
+    density = DensityAnalyzer(DENSITY_RESOLUTIONS)
+    density.compute(lat, lon)
+    density.save(DENSITY_PATH)
+    print(f"Density aggregates written to {DENSITY_PATH}")
+
+
+def publish_flight_density(flights: List[FlightData]) -> None:
+    """Пересчитывает плотность по списку полетов"""
+    publish_density(*DensityAnalyzer.takeoff_points(flights))
+
+
+def publish_rating(rating: Dict) -> None:
+    """Сохраняет рейтинг регионов для /regions/rating"""
+    publish_json(REGION_RATING_PATH, rating)
+    print(f"Region rating written to {REGION_RATING_PATH}")
+
+
+def publish_store_rating(store: FlightStore, analyzer: RegionAnalyzer) -> None:
+    """Пересчитывает рейтинг по агрегатам хранилища (длительности полетов вычислены при загрузке)"""
+    publish_rating(activity_rating(analyzer, *activity_arrays(analyzer, store.region_activity())))
+
+
+def publish_intervals(codes: np.ndarray, start: np.ndarray, end: np.ndarray) -> None:
+    """Сохраняет интервалы полетов для /flights/peak_concurrency"""
+    ConcurrencyAnalyzer.save(FLIGHT_INTERVALS_PATH, codes, start, end)
+    print(f"Flight intervals written to {FLIGHT_INTERVALS_PATH}")
+
+
+def publish_store_intervals(store: FlightStore) -> None:
+    """Пересчитывает интервалы полетов по хранилищу"""
+    rows = store.flight_intervals()
+    publish_intervals(*ConcurrencyAnalyzer.intervals(
+        [row[0] for row in rows], [FlightData.interval_from(*row[1:]) for row in rows]))
+
+
+def publish_flight_activity(flights: List[FlightData], codes: np.ndarray, analyzer: RegionAnalyzer) -> None:
+    """Пересчитывает рейтинг и интервалы по уникальным полетам и их кодам регионов"""
+    activity = RegionActivityAccumulator(analyzer)
+    activity.add(flights, codes)
+    publish_rating(activity.rating())
+    publish_intervals(*activity.intervals())
+
+
+def publish_proximity(points: FlightPointCollector) -> None:
+    """Строит и сохраняет индекс близости для /flights/near и /flights/nearest"""
+    FlightProximityIndex.build(points, FLIGHT_TREE_LEAF_SIZE).save(FLIGHT_TREE_PATH)
+    print(f"Proximity index written to {FLIGHT_TREE_PATH}")
+
+
+def publish_store_proximity(store: FlightStore) -> None:
+    """Перестраивает индекс близости по хранилищу"""
+    points = FlightPointCollector()
+    rows = store.flight_points()
+    for start in range(0, len(rows), store.batch_size):
+        batch = rows[start:start + store.batch_size]
+        points.add_points([row[0] for row in batch], [row[1] for row in batch],
+                          [(row[2], row[3]) if row[2] is not None and row[3] is not None else None for row in batch],
+                          [(row[4], row[5]) if row[4] is not None and row[5] is not None else None for row in batch])
+    publish_proximity(points)
+
+
+def publish_flight_proximity(flights: List[FlightData]) -> None:
+    """Перестраивает индекс близости по уникальным полетам (FlightDeduplicator.select)"""
+    points = FlightPointCollector()
+    points.add(flights)
+    publish_proximity(points)
+
+
+def publish_locate_report(analyzer: RegionAnalyzer) -> Dict[str, int]:
+    """Сохраняет и печатает число точек, привязанных к ближайшему региону и оставшихся вне регионов"""
+    report = dict(analyzer.locate_report, snap_km=LOCATE_SNAP_KM)
+    os.makedirs(os.path.dirname(LOCATE_REPORT_PATH), exist_ok=True)
+    with open(LOCATE_REPORT_PATH, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Located {report['points']} points: {report['snapped']} snapped to the nearest region "
+          f"within {LOCATE_SNAP_KM} km, {report['unmatched']} outside all regions")
+    return report
@@ -0,0 +1,194 @@
+
+import re
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from datetime import date
+from typing import Iterable, List, Optional, Set, Tuple
+from dev.backend.src.entities.flight import FlightData
+
+
+class _PartialFlight:
+    """Незавершенный полет: объединенные поля и типы уже полученных сообщений"""
+
+    __slots__ = ('key', 'flight', 'message_types', 'day', 'source')
+
+    def __init__(self, key: Tuple[str, str], flight: FlightData, day: Optional[int], source: Optional[str]):
+        self.key = key
+        self.flight = flight
+        self.message_types: Set[str] = set()
+        self.day = day
+        # File of the first message: a re-read of that file replaces the partial flight
+        self.source = source
+
+
+class MessageCorrelator:
+    """Потоковое объединение сообщений SHR/DEP/ARR одного полета (hash join по идентификатору и дате)"""
+
+    COMPLETE = {'SHR', 'DEP', 'ARR'}
+    MERGED_FIELDS = ['uav_type', 'takeoff_coordinates', 'landing_coordinates', 'takeoff_time',
+                     'landing_time', 'takeoff_date', 'landing_date', 'source_sheet']
+
+    def __init__(self, window_days: int = 2, max_pending: int = 100000, watermark_samples: int = 1001):
+        self.window_days = window_days
+        self.max_pending = max_pending
+        # Insertion order approximates arrival time, so stale partials sit at the front
+        self.pending: "OrderedDict[Tuple[str, str], _PartialFlight]" = OrderedDict()
+        # The watermark is the median date of recent messages: an outlier or misparsed date cannot move it
+        self.recent_days: deque = deque(maxlen=watermark_samples)
+        self.sorted_days: List[int] = []
+        self.watermark: Optional[int] = None
+        # File the messages being added come from
+        self.source: Optional[str] = None
+
+    @staticmethod
+    def normalize_id(flight_identification: Optional[str]) -> Optional[str]:
+        """Приводит идентификатор к общему виду (SHR дает 'SID/123)', DEP/ARR дают '123')"""
+        if not flight_identification:
+            return None
+        normalized = re.sub(r'[^\w]', '', str(flight_identification)).upper()
+        return normalized or None
+
+    @staticmethod
+    def _flight_date(flight: FlightData) -> Tuple[Optional[str], Optional[int]]:
+        """Возвращает дату полета (исходная строка, порядковый номер дня)"""
+        for value in (flight.takeoff_date, flight.landing_date):
+            if not value:
+                continue
+            day = None
+            if value.get('iso'):
+                try:
+                    day = date.fromisoformat(value['iso']).toordinal()
+                except ValueError:
+                    day = None
+            return value.get('original'), day
+        return None, None
+
+    @classmethod
+    def merge_row(cls, flights: List[FlightData]) -> List[Tuple[FlightData, Set[str]]]:
+        """Вливает сообщения строки без идентификатора в первое сообщение строки (как при разборе по строкам)"""
+        rows = [(flight, {flight.message_type} if flight.message_type else set())
+                for flight in flights if cls.normalize_id(flight.flight_identification)]
+        unkeyed = [flight for flight in flights if not cls.normalize_id(flight.flight_identification)]
+        if not unkeyed:
+            return rows
+        if not rows:
+            first = unkeyed.pop(0)
+            rows.append((first, {first.message_type} if first.message_type else set()))
+        target, message_types = rows[0]
+        for flight in unkeyed:
+            cls._merge(target, flight)
+            if flight.message_type:
+                message_types.add(flight.message_type)
+        return rows
+
+    def add_row(self, flights: List[FlightData]) -> List[FlightData]:
+        """Добавляет сообщения одной строки; возвращает полеты, которые завершены или вытеснены по окну"""
+        ready = []
+        for flight, message_types in self.merge_row(flights):
+            ready.extend(self.add(flight, message_types))
+        return ready
+
+    def add(self, flight: FlightData, message_types: Optional[Iterable[str]] = None) -> List[FlightData]:
+        """Добавляет сообщение (или слитые сообщения строки с их типами); возвращает завершенные и вытесненные полеты"""
+        if message_types is None:
+            message_types = [flight.message_type] if flight.message_type else []
+        flight_id = self.normalize_id(flight.flight_identification)
+        if flight_id is None:
+            # Nothing to join on
+            return [flight]
+
+        date_key, day = self._flight_date(flight)
+        key = (flight_id, date_key or '')
+        partial = self.pending.get(key)
+        if partial is None and 'ARR' in message_types and day is not None:
+            # Arrivals after midnight carry the next day's date
+            partial = self._find_previous_day(flight_id, day)
+
+        if partial is None:
+            partial = _PartialFlight(key, flight, day, self.source)
+            partial.flight.flight_identification = flight_id
+            self.pending[key] = partial
+        else:
+            self._merge(partial.flight, flight)
+            if partial.day is None:
+                partial.day = day
+        partial.message_types.update(message_types)
+
+        ready = []
+        if partial.message_types >= self.COMPLETE:
+            del self.pending[partial.key]
+            ready.append(partial.flight)
+
+        if day is not None:
+            self._observe(day)
+        ready.extend(self._evict(partial.key))
+        return ready
+
+    def restore(self, flight_id: str, date_key: str, day: Optional[int], message_types: Iterable[str],
+                flight: FlightData, source: Optional[str]) -> None:
+        """Возвращает в очередь незавершенный полет, сохраненный предыдущей загрузкой"""
+        partial = _PartialFlight((flight_id, date_key), flight, day, source)
+        partial.message_types.update(message_types)
+        self.pending[partial.key] = partial
+        if day is not None:
+            self._observe(day)
+
+    def discard_source(self, source: str) -> int:
+        """Убирает незавершенные полеты, начатые в файле source (перед его повторным чтением)"""
+        keys = [key for key, partial in self.pending.items() if partial.source == source]
+        for key in keys:
+            del self.pending[key]
+        return len(keys)
+
+    def partials(self) -> List[Tuple[str, str, Optional[int], Set[str], FlightData, Optional[str]]]:
+        """Незавершенные полеты: идентификатор, дата из сообщения, номер дня, типы сообщений, данные, файл"""
+        return [(partial.key[0], partial.key[1], partial.day, partial.message_types, partial.flight, partial.source)
+                for partial in self.pending.values()]
+
+    def flush(self) -> List[FlightData]:
+        """Возвращает все незавершенные полеты (конец потока)"""
+        flights = [partial.flight for partial in self.pending.values()]
+        self.pending.clear()
+        return flights
+
+    def _observe(self, day: int) -> None:
+        """Учитывает дату сообщения в скользящей медиане, которая служит водяным знаком окна"""
+        if len(self.recent_days) == self.recent_days.maxlen:
+            del self.sorted_days[bisect_left(self.sorted_days, self.recent_days[0])]
+        self.recent_days.append(day)
+        insort(self.sorted_days, day)
+        # Lower median: with two samples the far-ahead one still does not win
+        self.watermark = self.sorted_days[(len(self.sorted_days) - 1) // 2]
+
+    def _find_previous_day(self, flight_id: str, day: int) -> Optional[_PartialFlight]:
+        """Ищет незавершенный полет с тем же идентификатором, начавшийся накануне"""
+        # Same ДДММГГ convention as DataMapper._extract_date
+        previous = date.fromordinal(day - 1).strftime('%d%m%y')
+        partial = self.pending.get((flight_id, previous))
+        if partial is not None and 'ARR' not in partial.message_types:
+            return partial
+        return None
+
+    def _evict(self, current_key: Tuple[str, str]) -> List[FlightData]:
+        """Вытесняет полеты старше окна и лишние сверх max_pending (с начала очереди)"""
+        evicted = []
+        while self.pending:
+            key, partial = next(iter(self.pending.items()))
+            if key == current_key:
+                # Never evict the flight that has just received a message
+                break
+            stale = (self.watermark is not None and partial.day is not None
+                     and partial.day < self.watermark - self.window_days)
+            if not stale and len(self.pending) <= self.max_pending:
+                break
+            del self.pending[key]
+            evicted.append(partial.flight)
+        return evicted
+
+    @classmethod
+    def _merge(cls, target: FlightData, other: FlightData) -> None:
+        """Дополняет незаполненные поля target значениями из other"""
+        for field in cls.MERGED_FIELDS:
+            value = getattr(other, field)
+            if value and not getattr(target, field):
+                setattr(target, field, value)
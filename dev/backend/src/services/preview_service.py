@@ -0,0 +1,167 @@
+
+import threading
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from dev.backend.config import PREVIEW_FIRST_BATCH, PREVIEW_MAX_FRACTION, PREVIEW_TARGET_HALF_WIDTH, PREVIEW_Z
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.analyzers.sample_estimator import RegionShareEstimator
+from dev.backend.src.parsers.excel_parser import ExcelParser, SheetSample
+from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
+from dev.backend.src.services.stats_feed import publish_stats
+
+# Jobs live in the worker that accepted the upload; the published statistics file is shared by all workers
+_jobs: Dict[str, 'PreviewJob'] = {}
+_jobs_lock = threading.Lock()
+
+
+class PreviewJob:
+    """Фоновая обработка загрузки: сначала приближенная статистика по выборке, затем точная"""
+
+    def __init__(self, uploads: List[dict]):
+        self.id = uuid.uuid4().hex
+        self.state = 'queued'
+        self.uploads = uploads
+        self.sampled_rows = 0
+        self.total_rows = 0
+        self.inclusion = 0.0
+        self.max_half_width: Optional[float] = None
+        self.error: Optional[str] = None
+        with _jobs_lock:
+            _jobs[self.id] = self
+
+    def to_dict(self) -> dict:
+        """Состояние задачи для JSON"""
+        return {
+            "job": self.id,
+            "state": self.state,
+            "sampled_rows": self.sampled_rows,
+            "total_rows": self.total_rows,
+            "sample_fraction": self.inclusion,
+            "max_half_width": self.max_half_width,
+            "error": self.error,
+            "uploads": self.uploads,
+        }
+
+    def start(self, preview: Callable[['PreviewJob'], None], exact: Callable[[], Dict],
+              restore: Callable[[], None]) -> None:
+        """Запускает задачу в отдельном потоке; restore возвращает статистику, бывшую до оценки, если задача упала"""
+        def run():
+            try:
+                self.state = 'sampling'
+                preview(self)
+                self.state = 'exact'
+                exact()
+                self.state = 'done'
+            except Exception as e:
+                print(f"Upload job {self.id} failed: {e}")
+                self.state, self.error = 'failed', str(e)
+                # An estimate must not stay published as the current statistics once the exact pass is gone
+                try:
+                    restore()
+                except Exception as restore_error:
+                    print(f"Upload job {self.id}: previous statistics not restored: {restore_error}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+def get_job(job_id: str) -> Optional[PreviewJob]:
+    """Возвращает задачу по идентификатору"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+class SampleCursor:
+    """Обработанная часть выборки: строки прочитанных листов с ключом не больше порога"""
+
+    def __init__(self, excel_parser: ExcelParser, uav_parser: UAVFlightParser,
+                 estimator: RegionShareEstimator, fraction: float):
+        self.excel_parser = excel_parser
+        self.uav_parser = uav_parser
+        self.estimator = estimator
+        self.fraction = fraction
+        self.samples: List[SheetSample] = []
+        # Keys are uniform in [0, 1): a negative threshold means no row is processed yet
+        self.threshold = -1.0
+        self.processed = 0
+        self.total_rows = 0
+        self.finished = False
+
+    def add_sheet(self, sample: SheetSample) -> None:
+        """Добавляет прочитанный лист и сразу разбирает его строки до текущего порога"""
+        self.samples.append(sample)
+        self.total_rows += sample.total_rows
+        caught_up = np.flatnonzero(sample.keys <= self.threshold)
+        self._parse(np.full(len(caught_up), len(self.samples) - 1), caught_up)
+
+    def pending(self) -> int:
+        """Число строк выборки, еще не переданных оценщику"""
+        return sum(int(np.count_nonzero(sample.keys > self.threshold)) for sample in self.samples)
+
+    def advance(self, count: int) -> None:
+        """Разбирает следующие count строк по возрастанию ключа во всех прочитанных листах"""
+        keys = np.concatenate([sample.keys for sample in self.samples])
+        sheet = np.repeat(np.arange(len(self.samples)), [len(sample.keys) for sample in self.samples])
+        position = np.concatenate([np.arange(len(sample.keys)) for sample in self.samples])
+        pending = np.flatnonzero(keys > self.threshold)
+        chunk = pending[np.argsort(keys[pending], kind='stable')[:count]]
+        if len(chunk):
+            self._parse(sheet[chunk], position[chunk])
+            self.threshold = float(keys[chunk[-1]])
+
+    def inclusion(self) -> float:
+        """Вероятность строки попасть в обработанную часть: порог, а когда все листы прочитаны и разобраны - доля"""
+        if self.finished and not self.pending():
+            return self.fraction
+        return self.threshold
+
+    def _parse(self, sheets: np.ndarray, positions: np.ndarray) -> None:
+        if not len(positions):
+            return
+        self.estimator.add([self.excel_parser.parse_sample_row(self.samples[sheet], position, self.uav_parser)
+                            for sheet, position in zip(sheets, positions)])
+        self.uav_parser.clear_data()
+        self.processed += len(positions)
+
+
+def publish_preview(file_paths: List[str], excel_parser: ExcelParser, uav_parser: UAVFlightParser,
+                    analyzer: RegionAnalyzer, stats_path: str, job: Optional[PreviewJob] = None,
+                    estimator: Optional[RegionShareEstimator] = None) -> Dict:
+    """Публикует все более точные оценки долей регионов: после каждого прочитанного листа, затем по растущей выборке"""
+    rng = np.random.default_rng()
+    estimator = estimator or RegionShareEstimator(analyzer, PREVIEW_Z)
+    cursor = SampleCursor(excel_parser, uav_parser, estimator, PREVIEW_MAX_FRACTION)
+
+    def publish() -> Tuple[Dict, float]:
+        inclusion = cursor.inclusion()
+        stats = estimator.statistics(inclusion)
+        publish_stats(stats_path, stats)
+        half_width = estimator.max_half_width(inclusion)
+        print(f"Preview from {cursor.processed} of {cursor.total_rows} rows: max CI half-width {half_width:.2f} pp")
+        if job is not None:
+            job.sampled_rows, job.total_rows = cursor.processed, cursor.total_rows
+            job.inclusion, job.max_half_width = inclusion, half_width
+        return stats, half_width
+
+    # Processing rows by ascending key makes the processed part a uniform sample of every sheet read so far:
+    # each row is included independently with probability equal to the threshold. A new sheet is parsed up to
+    # the current threshold, so the first estimate is out after the first sheet rather than after the last one
+    for path in file_paths:
+        for sample in excel_parser.sample_excel(path, cursor.fraction, rng):
+            cursor.add_sheet(sample)
+            if cursor.processed < PREVIEW_FIRST_BATCH:
+                cursor.advance(PREVIEW_FIRST_BATCH - cursor.processed)
+            if cursor.processed:
+                publish()
+
+    cursor.finished = True
+    if not cursor.processed:
+        return {}
+    stats, half_width = publish()
+    batch = max(cursor.processed, PREVIEW_FIRST_BATCH)
+    # The exact pass follows anyway; stop sampling once the map is stable enough
+    while cursor.pending() and half_width > PREVIEW_TARGET_HALF_WIDTH:
+        cursor.advance(batch)
+        stats, half_width = publish()
+        batch *= 2
+    return stats
@@ -0,0 +1,55 @@
+
+from typing import Dict, Iterable, Optional
+from dev.backend.config import FRONTEND_JSON_PATH, FRONTEND_STATS_PATH, USE_SQLITE_STORAGE, SQLITE_DB_PATH, \
+    SQLITE_BATCH_SIZE, USE_STREAMING_PIPELINE, PIPELINE_CHUNK_SIZE, FRONTEND_NDJSON_PATH
+from dev.backend.src.analyzers.flight_deduplicator import FlightDeduplicator
+from dev.backend.src.analyzers.region_analyzer import RegionAnalyzer
+from dev.backend.src.parsers.excel_parser import ExcelParser
+from dev.backend.src.parsers.uav_flight_parser import UAVFlightParser
+from dev.backend.src.services.flight_pipeline import StreamingFlightPipeline
+from dev.backend.src.services.ingest_service import ingest_files_to_store, publish_flight_density, \
+    publish_flight_activity, publish_flight_proximity, publish_locate_report
+from dev.backend.src.services.publish_service import publish_json_array
+from dev.backend.src.services.stats_feed import publish_stats
+from dev.backend.src.storage.flight_store import FlightStore
+
+
+def process_excel_files(file_paths: Iterable[str], store: Optional[FlightStore] = None) -> Dict:
+    """Полная обработка файлов в режиме из конфигурации (SQLite, потоковый, пакетный); возвращает статистику"""
+    excel_parser = ExcelParser()
+    uav_parser = UAVFlightParser()
+    analyzer = RegionAnalyzer()
+
+    if USE_SQLITE_STORAGE:
+        store = store or FlightStore(SQLITE_DB_PATH, SQLITE_BATCH_SIZE)
+        stats = ingest_files_to_store(file_paths, store, excel_parser, uav_parser, analyzer)
+        write_statistics(stats)
+        return stats
+
+    if USE_STREAMING_PIPELINE:
+        pipeline = StreamingFlightPipeline(excel_parser, uav_parser, analyzer, PIPELINE_CHUNK_SIZE)
+        return pipeline.run(file_paths, FRONTEND_NDJSON_PATH, FRONTEND_STATS_PATH)
+
+    # One correlator for all files: SHR/DEP/ARR messages of a flight may sit in different workbooks
+    all_flights = list(excel_parser.iter_files(file_paths, uav_parser))
+
+    # Save flight data to JSON
+    publish_json_array(FRONTEND_JSON_PATH, (flight.to_dict() for flight in all_flights))
+    print(f"Output written to {FRONTEND_JSON_PATH}")
+
+    # Regions are located once: statistics and activity share the codes of the unique flights
+    unique_flights = FlightDeduplicator.unique(all_flights)
+    codes = analyzer.flight_codes(unique_flights, analyzer.locate_report)
+    stats = analyzer.statistics_from_codes(codes)
+    write_statistics(stats)
+    publish_flight_density(all_flights)
+    publish_flight_activity(unique_flights, codes, analyzer)
+    publish_flight_proximity(unique_flights)
+    publish_locate_report(analyzer)
+    return stats
+
+
+def write_statistics(stats: Dict) -> None:
+    """Сохраняет статистику по регионам в JSON для фронтенда"""
+    publish_stats(FRONTEND_STATS_PATH, stats)
+    print(f"Statistics written to {FRONTEND_STATS_PATH}")
@@ -0,0 +1,72 @@
+
+import gzip
+import json
+import os
+import shutil
+from typing import Iterable, List, Optional, Tuple
+from dev.backend.config import PUBLISH_GZIP_LEVEL, PUBLISH_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip sidecars are written without it
+    brotli = None
+
+# (Content-Encoding, file suffix) in order of preference
+COMPRESSED_ENCODINGS: List[Tuple[str, str]] = ([('br', '.br')] if brotli else []) + [('gzip', '.gz')]
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def publish_json(path: str, data) -> None:
+    """Записывает JSON без отступов и его сжатые копии"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    write_compressed_sidecars(path)
+
+
+def publish_json_array(path: str, items: Iterable[dict]) -> int:
+    """Записывает JSON-массив поэлементно (без сборки всего документа в памяти) и его сжатые копии"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for item in items:
+            if count:
+                f.write(',')
+            f.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+            count += 1
+        f.write(']')
+    os.replace(tmp_path, path)
+    write_compressed_sidecars(path)
+    return count
+
+
+def write_compressed_sidecars(path: str) -> None:
+    """Создает рядом с файлом .gz (и .br при наличии brotli) копии; старые копии без пары удаляются"""
+    for encoding, suffix in COMPRESSED_ENCODINGS:
+        tmp_path = path + suffix + ".tmp"
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            if encoding == 'gzip':
+                # mtime=0 only makes the compressed bytes deterministic; the served ETag still follows the file mtime
+                with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=PUBLISH_GZIP_LEVEL, mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, COPY_BUFFER_SIZE)
+            else:
+                compressor = brotli.Compressor(quality=PUBLISH_BROTLI_QUALITY)
+                for block in iter(lambda: src.read(COPY_BUFFER_SIZE), b''):
+                    dst.write(compressor.process(block))
+                dst.write(compressor.finish())
+        os.replace(tmp_path, path + suffix)
+    if brotli is None and os.path.exists(path + '.br'):
+        os.remove(path + '.br')
+
+
+def fresh_sidecar(path: str, suffix: str) -> Optional[str]:
+    """Возвращает путь к сжатой копии, если она есть и не старее исходного файла"""
+    sidecar = path + suffix
+    try:
+        return sidecar if os.path.getmtime(sidecar) >= os.path.getmtime(path) else None
+    except OSError:
+        return None
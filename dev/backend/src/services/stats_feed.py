@@ -0,0 +1,193 @@
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from dev.backend.config import STATS_VERSIONS_PATH, STATS_DELTA_HISTORY
+from dev.backend.src.services.publish_service import publish_json
+
+try:
+    import fcntl
+except ImportError:  # Windows: msvcrt byte-range locks instead
+    fcntl = None
+    import msvcrt
+
+# Values are compared after rounding, so float noise does not turn into deltas
+COMPARE_DIGITS = 9
+
+
+def stats_delta(old: Dict, new: Dict) -> Dict:
+    """Разница двух статистик: измененные регионы целиком и удаленные коды"""
+    def rounded(region: Dict) -> Dict:
+        return {key: round(value, COMPARE_DIGITS) if isinstance(value, float) else value
+                for key, value in region.items()}
+
+    changed = {code: region for code, region in new.items()
+               if code not in old or rounded(old[code]) != rounded(region)}
+    removed = [code for code in old if code not in new]
+    return {"changed": changed, "removed": removed}
+
+
+@contextmanager
+def exclusive_lock(lock_path: str) -> Iterator[None]:
+    """Межпроцессная эксклюзивная блокировка на время блока with"""
+    with open(lock_path, 'a+') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+            return
+        lock.seek(0)
+        while True:
+            try:
+                # LK_LOCK gives up after about 10 s of retries; keep waiting like flock does
+                msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+                break
+            except OSError:
+                continue
+        try:
+            yield
+        finally:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def load_versions(path: str) -> Optional[Dict]:
+    """Читает журнал версий статистики (None, если статистика еще не публиковалась)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def publish_stats(stats_path: str, stats: Dict, versions_path: Optional[str] = None) -> Optional[int]:
+    """Публикует статистику и дописывает в журнал версию с изменившимися регионами; возвращает номер версии"""
+    versions_path = versions_path or STATS_VERSIONS_PATH
+    os.makedirs(os.path.dirname(versions_path), exist_ok=True)
+    # Publishers may run in several processes (gunicorn workers, the CLI): the file and the log are written
+    # under one lock, so they end up in the same order and share no temporary files mid-write
+    with exclusive_lock(versions_path + ".lock"):
+        publish_json(stats_path, stats)
+        log = load_versions(versions_path) or {"epoch": uuid.uuid4().hex[:8], "version": 0, "stats": {}, "deltas": []}
+        delta = stats_delta(log["stats"], stats)
+        if not delta["changed"] and not delta["removed"]:
+            return log["version"]
+
+        version = log["version"] + 1
+        log = {
+            "epoch": log["epoch"],
+            "version": version,
+            "stats": stats,
+            "deltas": (log["deltas"] + [{"version": version, **delta}])[-STATS_DELTA_HISTORY:],
+        }
+        tmp_path = versions_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(log, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, versions_path)
+    print(f"Statistics version {version}: {len(delta['changed'])} regions changed, {len(delta['removed'])} removed")
+    return version
+
+
+def parse_event_id(event_id: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Разбирает идентификатор события вида <эпоха>-<версия>"""
+    if not event_id:
+        return None
+    epoch, _, version = event_id.rpartition('-')
+    try:
+        return epoch, int(version)
+    except ValueError:
+        return None
+
+
+def format_event(event: str, event_id: str, data: Dict) -> str:
+    """Формирует событие Server-Sent Events"""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class StatsFeed:
+    """Следит за журналом версий статистики и будит подписчиков; один поток наблюдения на процесс"""
+
+    def __init__(self, versions_path: str, poll_seconds: float = 0.5):
+        self.versions_path = versions_path
+        self.poll_seconds = poll_seconds
+        self.log: Optional[Dict] = None
+        self.mtime: Optional[Tuple[int, int]] = None
+        self.condition = threading.Condition()
+        self.watcher: Optional[threading.Thread] = None
+
+    def _reload(self) -> bool:
+        """Перечитывает журнал, если файл изменился"""
+        try:
+            stat = os.stat(self.versions_path)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self.mtime:
+            return False
+        log = load_versions(self.versions_path)
+        with self.condition:
+            self.mtime, self.log = mtime, log
+            self.condition.notify_all()
+        return True
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            self._reload()
+
+    def _ensure_watcher(self) -> None:
+        with self.condition:
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self._watch, daemon=True)
+                self.watcher.start()
+        if self.mtime is None:
+            self._reload()
+
+    def position(self) -> Optional[Tuple[str, int]]:
+        """Текущие эпоха и версия"""
+        log = self.log
+        return (log["epoch"], log["version"]) if log else None
+
+    def wait(self, last: Optional[Tuple[str, int]], timeout: float) -> None:
+        """Ждет новой версии относительно last не дольше timeout секунд"""
+        self._ensure_watcher()
+        with self.condition:
+            self.condition.wait_for(lambda: self.position() is not None and self.position() != last, timeout)
+
+    def events_since(self, last: Optional[Tuple[str, int]]) -> Tuple[List[str], Optional[Tuple[str, int]]]:
+        """События, которых клиент еще не видел: изменения по порядку или полный снимок, если их не восстановить"""
+        self._ensure_watcher()
+        log = self.log
+        if not log or (last is not None and last == (log["epoch"], log["version"])):
+            return [], last
+        position = (log["epoch"], log["version"])
+        deltas = [delta for delta in log["deltas"] if last is not None and delta["version"] > last[1]]
+        # Another epoch (the log was recreated), a version from the future or pruned history: start over
+        resumable = (last is not None and last[0] == log["epoch"] and last[1] < log["version"]
+                     and deltas and deltas[0]["version"] == last[1] + 1)
+        if not resumable:
+            return [format_event("snapshot", f"{log['epoch']}-{log['version']}",
+                                 {"version": log["version"], "stats": log["stats"]})], position
+        return [format_event("delta", f"{log['epoch']}-{delta['version']}", delta) for delta in deltas], position
+
+    def stream(self, last_event_id: Optional[str], heartbeat_seconds: float, max_seconds: float,
+               retry_ms: int) -> Iterator[str]:
+        """Поток событий для одного клиента; закрывается через max_seconds, клиент переподключается с Last-Event-ID"""
+        last = parse_event_id(last_event_id)
+        deadline = time.monotonic() + max_seconds
+        yield f"retry: {retry_ms}\n\n"
+        while True:
+            events, last = self.events_since(last)
+            if events:
+                yield ''.join(events)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            current = last
+            self.wait(current, min(heartbeat_seconds, remaining))
+            if self.position() == current:
+                # Comment lines keep proxies from closing an idle connection
+                yield ": keepalive\n\n"
@@ -0,0 +1,278 @@
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+from glob import glob
+from typing import IO, Generator, Iterable, Iterator, List, Optional
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+ARCHIVE_EXTENSIONS = ('.zip',)
+# A damaged, truncated, encrypted (RuntimeError) or unsupported (NotImplementedError) archive or member
+ARCHIVE_ERRORS = (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError)
+
+
+class UploadResult:
+    """Итог приема одного файла: accepted, duplicate, unsupported, too_large или invalid"""
+
+    def __init__(self, filename: str, status: str, path: Optional[str] = None,
+                 sha256: Optional[str] = None, size: int = 0, archive: Optional[str] = None):
+        self.filename = filename
+        self.status = status
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.archive = archive
+
+    def to_dict(self) -> dict:
+        """Преобразует результат в словарь для JSON"""
+        return {
+            "filename": self.filename,
+            "status": self.status,
+            "sha256": self.sha256,
+            "size": self.size,
+            "archive": self.archive,
+        }
+
+
+class HashingFile:
+    """Временный файл, который считает SHA-256 и размер по мере записи"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{uuid.uuid4().hex}.part")
+        self.file: IO[bytes] = open(self.path, 'wb')
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.hash.update(data)
+        self.size += len(data)
+
+    def close(self) -> str:
+        """Закрывает файл и возвращает SHA-256 содержимого"""
+        self.file.close()
+        return self.hash.hexdigest()
+
+    def discard(self) -> None:
+        """Удаляет временный файл"""
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadManifest:
+    """Журнал загруженных файлов по хешу содержимого (одна запись на хеш, создается атомарно)"""
+
+    def __init__(self, data_dir: str):
+        self.directory = os.path.join(data_dir, '.uploads')
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+            # Files uploaded before the manifest existed must count as known content too
+            for path in glob(os.path.join(data_dir, "*.xlsx")) + glob(os.path.join(data_dir, "*.xls")):
+                self.claim(file_sha256(path), os.path.basename(path), os.path.basename(path), os.path.getsize(path))
+
+    def claim(self, sha256: str, filename: str, stored_as: str, size: int) -> bool:
+        """Регистрирует содержимое; False, если такой файл уже загружался (в том числе другим процессом)"""
+        try:
+            # O_EXCL makes the check-and-record atomic across threads and gunicorn workers
+            fd = os.open(os.path.join(self.directory, f"{sha256}.json"), os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"filename": filename, "stored_as": stored_as, "size": size,
+                       "uploaded_at": time.strftime('%Y-%m-%dT%H:%M:%S')}, f, ensure_ascii=False)
+        return True
+
+    def release(self, sha256: str) -> None:
+        """Снимает регистрацию содержимого, которое не удалось сохранить (его можно загрузить снова)"""
+        try:
+            os.remove(os.path.join(self.directory, f"{sha256}.json"))
+        except FileNotFoundError:
+            pass
+
+
+class UploadReceiver:
+    """Потоковый прием multipart-загрузки: файлы пишутся на диск порциями и хешируются на лету"""
+
+    def __init__(self, data_dir: str, chunk_size: int = 1024 * 1024, max_unzipped_bytes: int = 4 * 1024 ** 3):
+        self.data_dir = data_dir
+        self.incoming_dir = os.path.join(data_dir, '.incoming')
+        self.chunk_size = chunk_size
+        self.max_unzipped_bytes = max_unzipped_bytes
+        self.manifest = UploadManifest(data_dir)
+
+    def receive(self, stream: IO[bytes], boundary: bytes, field_name: str = 'files') -> Iterator[UploadResult]:
+        """Разбирает тело запроса и отдает каждый файл (и каждый член архива), как только он записан"""
+        decoder = MultipartDecoder(boundary)
+        current: Optional[HashingFile] = None
+        filename = ''
+        try:
+            for data in self._chunks(stream):
+                decoder.receive_data(data)
+                event = decoder.next_event()
+                while not isinstance(event, (Epilogue, NeedData)):
+                    if isinstance(event, File) and event.name == field_name and event.filename:
+                        current, filename = HashingFile(self.incoming_dir), event.filename
+                    elif isinstance(event, Data) and current is not None:
+                        current.write(event.data)
+                        if not event.more_data:
+                            finished, current = current, None
+                            yield from self._store(finished, filename)
+                    event = decoder.next_event()
+        finally:
+            if current is not None:
+                current.discard()
+
+    def _chunks(self, stream: IO[bytes]) -> Iterator[Optional[bytes]]:
+        """Читает поток порциями; None в конце сообщает декодеру об окончании данных"""
+        while True:
+            data = stream.read(self.chunk_size)
+            if not data:
+                break
+            yield data
+        yield None
+
+    def _store(self, upload: HashingFile, filename: str, archive: Optional[str] = None) -> Iterator[UploadResult]:
+        """Проверяет расширение и хеш, затем переносит файл в каталог данных или распаковывает архив"""
+        sha256 = upload.close()
+        extension = os.path.splitext(filename)[1].lower()
+        allowed = EXCEL_EXTENSIONS if archive else EXCEL_EXTENSIONS + ARCHIVE_EXTENSIONS
+        if extension not in allowed:
+            upload.discard()
+            yield UploadResult(filename, 'unsupported', sha256=sha256, size=upload.size, archive=archive)
+            return
+
+        stored_as = self.stored_name(sha256, filename)
+        # Duplicates are rejected here, before any parsing
+        if not self.manifest.claim(sha256, filename, stored_as, upload.size):
+            upload.discard()
+            yield UploadResult(filename, 'duplicate', sha256=sha256, size=upload.size, archive=archive)
+            return
+
+        # The claim stays only once the content is stored in full; otherwise the same file may be sent again
+        stored = False
+        try:
+            if extension in ARCHIVE_EXTENSIONS:
+                try:
+                    stored = yield from self._extract(upload.path, filename, sha256)
+                finally:
+                    upload.discard()
+                return
+
+            path = os.path.join(self.data_dir, stored_as)
+            os.replace(upload.path, path)
+            stored = True
+            yield UploadResult(filename, 'accepted', path=path, sha256=sha256, size=upload.size, archive=archive)
+        finally:
+            if not stored:
+                upload.discard()
+                self.manifest.release(sha256)
+
+    def _extract(self, zip_path: str, archive_name: str, sha256: str) -> Generator[UploadResult, None, bool]:
+        """Распаковывает книги из архива по одной, отдавая каждую сразу после записи; True, если архив прочитан целиком"""
+        try:
+            archive = zipfile.ZipFile(zip_path)
+        except ARCHIVE_ERRORS as e:
+            print(f"Upload {archive_name}: not a readable archive ({e})")
+            yield UploadResult(archive_name, 'invalid', sha256=sha256, size=os.path.getsize(zip_path))
+            return False
+
+        complete = True
+        unpacked = 0
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # Member paths are never used on disk: only the base name, so "../" entries cannot escape
+                filename = os.path.basename(info.filename)
+                if os.path.splitext(filename)[1].lower() not in EXCEL_EXTENSIONS:
+                    yield UploadResult(filename, 'unsupported', size=info.file_size, archive=archive_name)
+                    continue
+                if unpacked + info.file_size > self.max_unzipped_bytes:
+                    yield UploadResult(filename, 'too_large', size=info.file_size, archive=archive_name)
+                    continue
+
+                member = HashingFile(self.incoming_dir)
+                try:
+                    with archive.open(info) as source:
+                        for block in iter(lambda: source.read(self.chunk_size), b''):
+                            member.write(block)
+                            # Declared sizes can lie: enforce the limit on the bytes actually produced
+                            if unpacked + member.size > self.max_unzipped_bytes:
+                                raise ValueError("archive exceeds the unpacked size limit")
+                except ValueError:
+                    member.discard()
+                    yield UploadResult(filename, 'too_large', size=member.size, archive=archive_name)
+                    continue
+                except ARCHIVE_ERRORS as e:
+                    # One damaged member does not spoil the others
+                    member.discard()
+                    complete = False
+                    print(f"Upload {archive_name}: member {filename} is unreadable ({e})")
+                    yield UploadResult(filename, 'invalid', size=member.size, archive=archive_name)
+                    continue
+                unpacked += member.size
+                yield from self._store(member, filename, archive_name)
+        return complete
+
+    @staticmethod
+    def stored_name(sha256: str, filename: str) -> str:
+        """Безопасное имя файла на диске: префикс хеша и очищенное исходное имя"""
+        stem, extension = os.path.splitext(os.path.basename(filename.replace('\\', '/')))
+        # secure_filename drops non-ASCII letters, so Cyrillic names fall back to a fixed stem
+        stem = secure_filename(stem) or 'upload'
+        return f"{sha256[:16]}-{stem}{extension.lower()}"
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_in_background(items: Iterable) -> Iterator:
+    """Выполняет генератор в отдельном потоке: потребитель обрабатывает элементы, пока следующие еще готовятся"""
+    results: "queue.Queue" = queue.Queue()
+    done = object()
+
+    def produce():
+        try:
+            for item in items:
+                results.put(item)
+        except BaseException as e:
+            results.put(e)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+    thread.join()
+
+
+def accepted_paths(results: Iterable[UploadResult], log: List[UploadResult]) -> Iterator[str]:
+    """Пропускает дальше только принятые файлы; все результаты записываются в log"""
+    for result in results:
+        log.append(result)
+        print(f"Upload {result.filename}: {result.status}")
+        if result.status == 'accepted':
+            yield result.path
@@ -0,0 +1,376 @@
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from dev.backend.config import SQLITE_BUSY_TIMEOUT
+from dev.backend.src.entities.flight import FlightData
+
+
+class FlightStore:
+    """Встроенное хранилище SQLite для полетов, регионов и агрегатов"""
+
+    # Plain SQL types only, so the same schema can be moved to PostGIS later.
+    # SQLite assigns ids on insert, so concurrent writers never compute the same one
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS flights (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            flight_identification TEXT,
+            uav_type TEXT,
+            takeoff_lat REAL,
+            takeoff_lon REAL,
+            landing_lat REAL,
+            landing_lon REAL,
+            takeoff_time TEXT,
+            landing_time TEXT,
+            takeoff_date TEXT,
+            landing_date TEXT,
+            source_sheet TEXT,
+            source_file TEXT,
+            region_code INTEGER,
+            duration_hours REAL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_flights_takeoff_date ON flights (takeoff_date)",
+        "CREATE INDEX IF NOT EXISTS idx_flights_region_code ON flights (region_code)",
+        "CREATE INDEX IF NOT EXISTS idx_flights_identification ON flights (flight_identification)",
+        """CREATE VIRTUAL TABLE IF NOT EXISTS takeoff_rtree USING rtree (
+            id, min_lat, max_lat, min_lon, max_lon
+        )""",
+        """CREATE VIRTUAL TABLE IF NOT EXISTS landing_rtree USING rtree (
+            id, min_lat, max_lat, min_lon, max_lon
+        )""",
+        """CREATE TABLE IF NOT EXISTS regions (
+            code INTEGER PRIMARY KEY,
+            name TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS region_stats (
+            code INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            drone_count REAL NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS ingested_files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            flights INTEGER NOT NULL
+        )""",
+        # Partial flights (not all of SHR/DEP/ARR seen yet) carried over to the next ingest.
+        # flight_id is the row standing in for the partial flight in flights meanwhile (NULL if it has no coordinates)
+        """CREATE TABLE IF NOT EXISTS pending_flights (
+            id INTEGER PRIMARY KEY,
+            flight_id INTEGER,
+            flight_key TEXT NOT NULL,
+            date_key TEXT NOT NULL,
+            day INTEGER,
+            message_types TEXT NOT NULL,
+            flight TEXT NOT NULL,
+            source_file TEXT
+        )""",
+    ]
+
+    FLIGHT_COLUMNS = ['id', 'flight_identification', 'uav_type', 'takeoff_lat', 'takeoff_lon',
+                      'landing_lat', 'landing_lon', 'takeoff_time', 'landing_time',
+                      'takeoff_date', 'landing_date', 'source_sheet', 'source_file', 'region_code',
+                      'duration_hours']
+
+    # Filled fields of a row, as FlightData.completeness counts them
+    COMPLETENESS = ("(takeoff_lat IS NOT NULL AND takeoff_lon IS NOT NULL) "
+                    "+ (landing_lat IS NOT NULL AND landing_lon IS NOT NULL) "
+                    "+ (COALESCE(takeoff_time, '') <> '') + (COALESCE(landing_time, '') <> '') "
+                    "+ (COALESCE(takeoff_date, '') <> '') + (COALESCE(landing_date, '') <> '') "
+                    "+ (COALESCE(uav_type, '') <> '')")
+
+    # One row per flight, the one FlightDeduplicator keeps: the most complete record with coordinates, then the first
+    BEST_FLIGHT_IDS = ("SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY flight_identification "
+                       f"ORDER BY {COMPLETENESS} DESC, id) AS position FROM flights "
+                       "WHERE flight_identification IS NOT NULL AND (takeoff_lat IS NOT NULL OR landing_lat IS NOT NULL)) "
+                       "WHERE position = 1")
+
+    # Columns added after the schema was first released: (table, column, type)
+    MIGRATIONS = [('flights', 'duration_hours', 'REAL')]
+
+    def __init__(self, db_path: str, batch_size: int = 5000, busy_timeout: float = SQLITE_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.busy_timeout = busy_timeout
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connect(write=True) as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            self._migrate(conn)
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Добавляет новые столбцы в существующую базу; файлы будут загружены заново при следующем импорте"""
+        for table, column, column_type in self.MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                # Old rows have no value for the new column: forget ingested files so they are re-read
+                conn.execute("DELETE FROM ingested_files")
+
+    @contextmanager
+    def _connect(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        """Открывает соединение с транзакцией (по одному на операцию, чтобы работать из нескольких потоков)"""
+        # Writers from other threads, gunicorn workers or the CLI are waited for instead of failing at once
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with conn:
+                if write:
+                    # Take the write lock up front: a deferred transaction that reads first cannot wait
+                    # for the lock later and fails with "database is locked"
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    def is_ingested(self, file_path: str) -> bool:
+        """Проверяет, загружен ли файл в текущей версии (по размеру и времени изменения)"""
+        stat = os.stat(file_path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT size, mtime FROM ingested_files WHERE path = ?",
+                               (os.path.abspath(file_path),)).fetchone()
+        return row is not None and row['size'] == stat.st_size and row['mtime'] == stat.st_mtime
+
+    def ingest_file(self, file_path: str, flights: List[FlightData],
+                    region_codes: Optional[List[Optional[int]]] = None) -> int:
+        """Загружает полеты одного файла в одной транзакции, заменяя прежние строки этого файла"""
+        source = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._connect(write=True) as conn:
+            self._delete_source(conn, source)
+            inserted = self._insert(conn, flights, region_codes, source)
+            conn.execute("INSERT OR REPLACE INTO ingested_files (path, size, mtime, flights) VALUES (?, ?, ?, ?)",
+                         (source, stat.st_size, stat.st_mtime, inserted))
+        return inserted
+
+    def insert_flights(self, flights: List[FlightData],
+                       region_codes: Optional[List[Optional[int]]] = None,
+                       source_file: Optional[str] = None) -> int:
+        """Пакетно вставляет полеты в одной транзакции"""
+        with self._connect(write=True) as conn:
+            return self._insert(conn, flights, region_codes, source_file)
+
+    def _insert(self, conn: sqlite3.Connection, flights: List[FlightData],
+                region_codes: Optional[List[Optional[int]]], source_file: Optional[str]) -> int:
+        """Вставляет полеты пачками через executemany (вызывается внутри транзакции с блокировкой записи)"""
+        # New rows get ids above the current maximum; the write lock keeps other writers out meanwhile
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM flights").fetchone()[0]
+        columns = self.FLIGHT_COLUMNS[1:]
+        flight_sql = f"INSERT INTO flights ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+
+        rows = []
+        total = 0
+        for i, flight in enumerate(flights):
+            region_code = region_codes[i] if region_codes is not None else None
+            rows.append(self._flight_row(flight, region_code, source_file))
+            if len(rows) >= self.batch_size:
+                conn.executemany(flight_sql, rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            conn.executemany(flight_sql, rows)
+            total += len(rows)
+
+        # R-tree rows are copied from the inserted flights, so they carry the ids SQLite assigned
+        for point in ('takeoff', 'landing'):
+            conn.execute(
+                f"INSERT INTO {point}_rtree SELECT id, {point}_lat, {point}_lat, {point}_lon, {point}_lon "
+                f"FROM flights WHERE id > ? AND {point}_lat IS NOT NULL AND {point}_lon IS NOT NULL", (last_id,))
+        return total
+
+    @staticmethod
+    def _flight_row(flight: FlightData, region_code: Optional[int], source_file: Optional[str]) -> Tuple:
+        """Преобразует FlightData в строку таблицы flights (без id, его назначает SQLite)"""
+        takeoff = flight.takeoff_coordinates or (None, None)
+        landing = flight.landing_coordinates or (None, None)
+        return (
+            flight.flight_identification,
+            flight.uav_type,
+            takeoff[0], takeoff[1],
+            landing[0], landing[1],
+            flight.takeoff_time,
+            flight.landing_time,
+            (flight.takeoff_date or {}).get('iso'),
+            (flight.landing_date or {}).get('iso'),
+            flight.source_sheet,
+            source_file,
+            region_code,
+            flight.get_duration_hours(),
+        )
+
+    @staticmethod
+    def _delete_source(conn: sqlite3.Connection, source: str) -> None:
+        """Удаляет строки ранее загруженной версии файла"""
+        ids = "SELECT id FROM flights WHERE source_file = ?"
+        conn.execute(f"DELETE FROM takeoff_rtree WHERE id IN ({ids})", (source,))
+        conn.execute(f"DELETE FROM landing_rtree WHERE id IN ({ids})", (source,))
+        conn.execute("DELETE FROM flights WHERE source_file = ?", (source,))
+        # Partial flights started in the file are read again with it
+        conn.execute("DELETE FROM pending_flights WHERE source_file = ?", (source,))
+
+    def pending_flights(self) -> List[Tuple[int, str, str, Optional[int], List[str], FlightData, Optional[str]]]:
+        """Незавершенные полеты прошлых загрузок (id, ключ, дата из сообщения, день, типы сообщений, данные, файл)"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id, flight_key, date_key, day, message_types, flight, source_file "
+                                "FROM pending_flights ORDER BY id").fetchall()
+        return [(row['id'], row['flight_key'], row['date_key'], row['day'], json.loads(row['message_types']),
+                 FlightData.from_dict(json.loads(row['flight'])), row['source_file']) for row in rows]
+
+    def save_pending(self, replaced_ids: List[int],
+                     partials: Iterable[Tuple[str, str, Optional[int], Set[str], FlightData, Optional[str]]],
+                     region_codes: List[Optional[int]], valid: List[bool]) -> int:
+        """Заменяет восстановленные загрузкой незавершенные полеты (replaced_ids) оставшимися после нее"""
+        with self._connect(write=True) as conn:
+            # Restored partials were either completed (and stored with their last file) or are saved again below
+            for start in range(0, len(replaced_ids), self.batch_size):
+                batch = replaced_ids[start:start + self.batch_size]
+                ids = f"SELECT flight_id FROM pending_flights WHERE id IN ({', '.join('?' for _ in batch)})"
+                for table in ('takeoff_rtree', 'landing_rtree', 'flights'):
+                    conn.execute(f"DELETE FROM {table} WHERE id IN ({ids})", batch)
+                conn.execute(f"DELETE FROM pending_flights WHERE id IN ({', '.join('?' for _ in batch)})", batch)
+
+            # Partial flights with coordinates count as flights until they are completed, as in the other modes
+            by_source: Dict[Optional[str], List[Tuple]] = {}
+            for partial, region_code, is_valid in zip(partials, region_codes, valid):
+                by_source.setdefault(partial[5], []).append((partial, region_code, is_valid))
+            saved = 0
+            for source, group in by_source.items():
+                stored = [(partial, region_code) for partial, region_code, is_valid in group if is_valid]
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM flights").fetchone()[0]
+                self._insert(conn, [partial[4] for partial, _ in stored], [code for _, code in stored], source)
+                flight_ids = iter(row[0] for row in conn.execute(
+                    "SELECT id FROM flights WHERE id > ? ORDER BY id", (last_id,)).fetchall())
+                conn.executemany(
+                    "INSERT INTO pending_flights (flight_id, flight_key, date_key, day, message_types, flight, "
+                    "source_file) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(next(flight_ids) if is_valid else None, flight_key, date_key, day,
+                      json.dumps(sorted(message_types)), json.dumps(flight.to_dict(), ensure_ascii=False), source)
+                     for (flight_key, date_key, day, message_types, flight, _), _, is_valid in group])
+                saved += len(group)
+        return saved
+
+    def save_regions(self, regions: Dict[int, str]) -> None:
+        """Сохраняет справочник регионов"""
+        with self._connect(write=True) as conn:
+            conn.executemany("INSERT OR REPLACE INTO regions (code, name) VALUES (?, ?)", list(regions.items()))
+
+    def save_region_stats(self, stats: Dict) -> None:
+        """Заменяет агрегаты по регионам (формат flight_statistics.json)"""
+        rows = [(int(code), value['name'], value['drone_count']) for code, value in stats.items()]
+        with self._connect(write=True) as conn:
+            conn.execute("DELETE FROM region_stats")
+            conn.executemany("INSERT INTO region_stats (code, name, drone_count) VALUES (?, ?, ?)", rows)
+
+    def load_region_stats(self) -> Dict:
+        """Возвращает агрегаты по регионам в формате flight_statistics.json"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT code, name, drone_count FROM region_stats").fetchall()
+        return {str(row['code']): {"name": row['name'], "drone_count": row['drone_count']} for row in rows}
+
+    def region_counts(self) -> Tuple[Dict[int, int], int]:
+        """Считает уникальные полеты по регионам и общее число уникальных полетов с координатами"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT region_code, COUNT(*) AS cnt FROM flights WHERE id IN ({self.BEST_FLIGHT_IDS}) "
+                "GROUP BY region_code").fetchall()
+        total = sum(row['cnt'] for row in rows)
+        return {row['region_code']: row['cnt'] for row in rows if row['region_code'] is not None}, total
+
+    def region_activity(self) -> List[Tuple[int, int, float, int]]:
+        """Возвращает по регионам (код, уникальные полеты, летные часы, уникальные типы БВС)"""
+        with self._connect() as conn:
+            # Aggregated over one row per flight, as RegionActivityAccumulator does: repeated ids add no hours
+            return conn.execute(
+                "SELECT region_code, COUNT(*), COALESCE(SUM(duration_hours), 0), COUNT(DISTINCT uav_type) "
+                f"FROM flights WHERE region_code IS NOT NULL AND id IN ({self.BEST_FLIGHT_IDS}) "
+                "GROUP BY region_code").fetchall()
+
+    def flight_intervals(self) -> List[Tuple[int, str, str, str, str]]:
+        """Возвращает (код, дата и время взлета, дата и время посадки) по одной строке на полет"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT region_code, takeoff_date, takeoff_time, landing_date, landing_time FROM flights "
+                f"WHERE region_code IS NOT NULL AND id IN ({self.BEST_FLIGHT_IDS})").fetchall()
+
+    def flight_points(self) -> List[Tuple[str, str, float, float, float, float]]:
+        """Возвращает (идентификатор, дата взлета, координаты взлета и посадки) по одной строке на полет"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT flight_identification, takeoff_date, takeoff_lat, takeoff_lon, landing_lat, landing_lon "
+                f"FROM flights WHERE id IN ({self.BEST_FLIGHT_IDS})").fetchall()
+
+    def takeoff_points(self) -> List[Tuple[float, float]]:
+        """Возвращает все точки взлета (lat, lon)"""
+        with self._connect() as conn:
+            return conn.execute("SELECT takeoff_lat, takeoff_lon FROM flights "
+                                "WHERE takeoff_lat IS NOT NULL AND takeoff_lon IS NOT NULL").fetchall()
+
+    def location_points(self) -> List[Tuple[int, float, float]]:
+        """Возвращает (id, lat, lon) точки определения региона: взлет, а если его нет, посадка"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, COALESCE(takeoff_lat, landing_lat), COALESCE(takeoff_lon, landing_lon) FROM flights "
+                "WHERE (takeoff_lat IS NOT NULL AND takeoff_lon IS NOT NULL) "
+                "OR (landing_lat IS NOT NULL AND landing_lon IS NOT NULL)").fetchall()
+
+    def update_region_codes(self, ids: List[int], codes: List[Optional[int]]) -> None:
+        """Пакетно обновляет коды регионов в одной транзакции"""
+        rows = list(zip(codes, ids))
+        with self._connect(write=True) as conn:
+            for start in range(0, len(rows), self.batch_size):
+                conn.executemany("UPDATE flights SET region_code = ? WHERE id = ?", rows[start:start + self.batch_size])
+
+    def filter_flights(self, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                       region_code: Optional[int] = None,
+                       bbox: Optional[Tuple[float, float, float, float]] = None,
+                       point: str = 'takeoff', limit: int = 1000, offset: int = 0) -> List[Dict]:
+        """Выбирает полеты по дате (ISO), коду региона и прямоугольнику (min_lat, min_lon, max_lat, max_lon)"""
+        conditions, params = [], []
+        if date_from:
+            conditions.append("f.takeoff_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("f.takeoff_date <= ?")
+            params.append(date_to)
+        if region_code is not None:
+            conditions.append("f.region_code = ?")
+            params.append(region_code)
+
+        sql = f"SELECT {', '.join('f.' + col for col in self.FLIGHT_COLUMNS)} FROM flights f"
+        if bbox:
+            rtree = 'landing_rtree' if point == 'landing' else 'takeoff_rtree'
+            sql += f" JOIN {rtree} r ON r.id = f.id"
+            conditions.append("r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?")
+            min_lat, min_lon, max_lat, max_lon = bbox
+            params.extend([min_lat, max_lat, min_lon, max_lon])
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY f.id LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict:
+        """Преобразует строку таблицы в словарь в формате all_data_from_back.json"""
+        def coords(lat, lon):
+            return [lat, lon] if lat is not None and lon is not None else None
+
+        return {
+            "flight_identification": row['flight_identification'],
+            "uav_type": row['uav_type'],
+            "takeoff_coordinates": coords(row['takeoff_lat'], row['takeoff_lon']),
+            "landing_coordinates": coords(row['landing_lat'], row['landing_lon']),
+            "takeoff_time": row['takeoff_time'],
+            "landing_time": row['landing_time'],
+            "takeoff_date": row['takeoff_date'],
+            "landing_date": row['landing_date'],
+            "source_sheet": row['source_sheet'],
+            "region_code": row['region_code'],
+        }
@@ -1,13 +1,14 @@
 
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 import pandas as pd
 import re
+from dev.backend.src.utils.keyword_automaton import KeywordAutomaton
 
 
 class DataMapper:
     """Маппер для колонок и полей"""
 
-    def __init__(self):
+    def __init__(self, code_keywords: Iterable[str] = ()):
         self.column_mappings = {
             'flight_identification': ['рейс', 'flight', 'sid', 'pln', 'п/п', 'телеграмма pln'],
             'uav_type': ['тип', 'type', 'группа', 'борт', 'model', 'typ', 'shr', 'тип вс', 'борт. номер вс.'],
@@ -18,29 +19,49 @@ class DataMapper:
             'takeoff_date': ['дата', 'date', 'полёта', 'дата вылета', 'add'],
             'landing_date': ['дата', 'date', 'полёта', 'дата посадки', 'ada']
         }
+        self.record_separators = ['===', '---', '***', 'январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+                                  'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь']
+        # One automaton over lowercased text finds field keywords, separators and code dictionary entries;
+        # codes are case-sensitive, so callers confirm the few lowercased candidates against the original text
+        self.field_keywords = {field: [kw.lower() for kw in keywords]
+                               for field, keywords in self.column_mappings.items()}
+        self.separator_keywords = frozenset(sep.lower() for sep in self.record_separators)
+        self.keyword_automaton = KeywordAutomaton.shared(
+            [kw for keywords in self.field_keywords.values() for kw in keywords] + sorted(self.separator_keywords)
+            + [code.lower() for code in code_keywords])
         self.coord_patterns = [
             r'(\d+\.\d+)[,\s]+(\d+\.\d+)',  # Decimal: 55.123,37.456
             r'(\d{2,4})([NS])(\d{2,5})([EW])'  # DMS: 5530N03730E
         ]
 
+    def find_keywords(self, text: str) -> Set[str]:
+        """Все ключевые слова, входящие в текст (без учета регистра, в нижнем регистре), за один проход"""
+        return self.keyword_automaton.find(str(text).lower())
+
+    def first_keywords(self, found: Set[str]) -> Dict[str, str]:
+        """Для каждого поля - первое по порядку в column_mappings из найденных ключевых слов"""
+        result = {}
+        for field, keywords in self.field_keywords.items():
+            for kw in keywords:
+                if kw in found:
+                    result[field] = kw
+                    break
+        return result
+
     def identify_columns(self, columns: List[str]) -> Dict:
         """Идентифицирует столбцы, сопоставляя их с полями JSON"""
-        mapping = {}
-        for field, keywords in self.column_mappings.items():
-            for col in columns:
-                col_lower = str(col).lower()
-                if any(kw.lower() in col_lower for kw in keywords):
-                    mapping[field] = col
-                    break
-        return mapping
+        # Each header is scanned once, left to right, until every field has its first matching column
+        found = {}
+        for col in columns:
+            for field in self.first_keywords(self.find_keywords(col)):
+                found.setdefault(field, col)
+            if len(found) == len(self.field_keywords):
+                break
+        return {field: found[field] for field in self.field_keywords if field in found}
 
     def classify_field(self, field_name: str) -> Optional[str]:
         """Классифицирует поле для формата ключ-значение"""
-        field_lower = field_name.lower()
-        for field, keywords in self.column_mappings.items():
-            if any(kw.lower() in field_lower for kw in keywords):
-                return field
-        return None
+        return next(iter(self.first_keywords(self.find_keywords(field_name))), None)
 
     def parse_field_value(self, field_type: str, value) -> Optional[any]:
         """Парсит значение в зависимости от типа поля"""
@@ -123,7 +144,5 @@ class DataMapper:
 
     def is_record_separator(self, text: str) -> bool:
         """Проверяет, является ли строка разделителем записей"""
-        separators = ['===', '---', '***', 'январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
-                      'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь']
-        return any(sep.lower() in text.lower() for sep in separators) or text.strip() == ""
+        return not self.separator_keywords.isdisjoint(self.find_keywords(text)) or text.strip() == ""
 
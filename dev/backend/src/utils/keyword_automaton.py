@@ -0,0 +1,58 @@
+
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+# Automata are built once per keyword list and shared by every mapper and parser instance
+_shared: Dict[Tuple[str, ...], 'KeywordAutomaton'] = {}
+
+
+class KeywordAutomaton:
+    """Автомат Ахо-Корасик: все ключевые слова, входящие в текст, за один проход"""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = [keyword for keyword in dict.fromkeys(keywords) if keyword]
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[str]] = [set()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    output.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            output[state].add(keyword)
+
+        # Breadth-first order guarantees the fail target of a state is complete before the state itself.
+        # Folding fail links into full transition tables leaves one dict lookup per character while scanning
+        transitions: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] |= output[fail[state]]
+            transitions[state] = {**transitions[fail[state]], **goto[state]}
+            for char, child in goto[state].items():
+                fail[child] = transitions[fail[state]].get(char, 0)
+                queue.append(child)
+        self.transitions = transitions
+        self.outputs: List[FrozenSet[str]] = [frozenset(keywords) for keywords in output]
+
+    @classmethod
+    def shared(cls, keywords: Iterable[str]) -> 'KeywordAutomaton':
+        """Возвращает общий автомат для набора ключевых слов (строится при первом запросе)"""
+        key = tuple(keywords)
+        if key not in _shared:
+            _shared[key] = cls(key)
+        return _shared[key]
+
+    def find(self, text: str) -> Set[str]:
+        """Множество ключевых слов, входящих в текст (с учетом регистра)"""
+        transitions, outputs = self.transitions, self.outputs
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
@@ -0,0 +1,53 @@
+
+import json
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+import numpy as np
+from dev.backend.config import REGIONS_REGISTRY_PATH
+
+
+class RegionRegistry:
+    """Справочник субъектов РФ: числовые коды, официальные названия и синонимы"""
+
+    def __init__(self, regions: List[Dict]):
+        self.names: Dict[int, str] = {}
+        self._by_name: Dict[str, int] = {}
+        for region in regions:
+            code = int(region['code'])
+            self.names[code] = region['name']
+            for name in [region['name']] + region.get('aliases', []):
+                self._by_name[self.normalize(name)] = code
+        # Codes index bincount arrays directly; 0 means "no region"
+        self.size = max(self.names) + 1
+
+    @classmethod
+    def load(cls, path: str) -> 'RegionRegistry':
+        """Загружает справочник из JSON"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        """Приводит название к виду для сравнения: регистр, ё, тире и пробелы"""
+        text = str(name).strip().lower().replace('ё', 'е')
+        text = re.sub(r'\s*[—–-]\s*', '-', text)
+        return re.sub(r'\s+', ' ', text)
+
+    def resolve(self, name: str) -> Optional[int]:
+        """Возвращает код региона по официальному названию или синониму"""
+        return self._by_name.get(self.normalize(name))
+
+    def name(self, code: int) -> Optional[str]:
+        """Возвращает официальное название региона"""
+        return self.names.get(int(code))
+
+    def codes_for(self, names) -> np.ndarray:
+        """Преобразует названия в массив кодов (0 для неизвестных)"""
+        return np.array([self.resolve(name) or 0 for name in names], dtype=np.int16)
+
+
+@lru_cache(maxsize=1)
+def get_region_registry() -> RegionRegistry:
+    """Справочник регионов, загружаемый один раз на процесс"""
+    return RegionRegistry.load(REGIONS_REGISTRY_PATH)
@@ -5,7 +5,8 @@ var regionsInfo = {};
 const rootUrl = window.location.origin;  //    
 
 const contracts = {
-    update_url: rootUrl + "/flights_percent"
+    update_url: rootUrl + "/flights_percent",
+    stream_url: rootUrl + "/flights_percent/stream"
 };
 /* const accentColors = {
     70: "red",
@@ -49,30 +50,42 @@ function update() {
 
     })
         .then(r => r.json())
-        .then(data => {
-            // console.log(data);
-            window.regionsInfo = data;
-            // console.log("response:");
-            // console.log(window.regionsInfo);
-            window.totalDroneCount = 0;
-            for (const key in window.regionsInfo) {
-                window.totalDroneCount += window.regionsInfo[key]?.drone_count;
-            }
-            //  ;
-            regions.forEach(i => {
-                //     
-                const regNum = i.attributes["reg-num"]?.nodeValue || -1; // 
-                const persent = window.regionsInfo[regNum]?.drone_count;
-                console.log(persent);
-                const color = getColor(persent);
-                // console.log(color);
-                i["style"].fill = color;
-            });
-        });
+        .then(renderRegions);
+}
+
+function renderRegions(data) {
+    // console.log(data);
+    window.regionsInfo = data;
+    // console.log("response:");
+    // console.log(window.regionsInfo);
+    window.totalDroneCount = 0;
+    for (const key in window.regionsInfo) {
+        window.totalDroneCount += window.regionsInfo[key]?.drone_count;
+    }
+    //  ;
+    regions.forEach(i => {
+        //     
+        const regNum = i.attributes["reg-num"]?.nodeValue || -1; // 
+        const persent = window.regionsInfo[regNum]?.drone_count;
+        console.log(persent);
+        const color = getColor(persent);
+        // console.log(color);
+        i["style"].fill = color;
+    });
 }
 
 document.querySelector("button#test").addEventListener("click", update);
 
+// Live updates: a snapshot on connect, then only the regions that changed; EventSource resumes by Last-Event-ID
+const statsStream = new EventSource(contracts.stream_url);
+statsStream.addEventListener("snapshot", e => renderRegions(JSON.parse(e.data).stats));
+statsStream.addEventListener("delta", e => {
+    const delta = JSON.parse(e.data);
+    const data = Object.assign({}, window.regionsInfo, delta.changed);
+    delta.removed.forEach(code => delete data[code]);
+    renderRegions(data);
+});
+
 /* document.querySelector("button#test").addEventListener("click", () => regions.forEach(i => {
     /!*  if (i.attributes['data-title'].nodeValue.includes("")){
          console.log(" ")